@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022  Ergus
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compare two campaigns of process_dim results and fail on regressions.
+#
+# ./compare.py baseline.json candidate.json --threshold 0.05 --alpha 0.05
+
+import grapher as gr
+import sys
+import math
+import argparse
+import pandas as pd
+import numpy as np
+from typing import *
+
+
+def betainc(a : np.ndarray, b : np.ndarray, x : np.ndarray) -> np.ndarray:
+    """Regularized incomplete beta I_x(a, b) of arrays.
+
+    Continued fraction with the modified Lentz method, evaluated where it
+    converges fast and with I_x(a, b) = 1 - I_{1-x}(b, a) elsewhere.
+    """
+    a, b, x = np.broadcast_arrays(np.asarray(a, dtype=float),
+                                  np.asarray(b, dtype=float),
+                                  np.asarray(x, dtype=float))
+    swap : np.ndarray = x > (a + 1) / (a + b + 2)
+    a, b, x = np.where(swap, b, a), np.where(swap, a, b), np.where(swap, 1 - x, x)
+
+    lgamma = np.vectorize(math.lgamma, otypes=[float])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        front : np.ndarray = np.exp(lgamma(a + b) - lgamma(a) - lgamma(b)
+                                    + a * np.log(x) + b * np.log1p(-x)) / a
+
+        tiny : float = 1e-300
+        c : np.ndarray = np.ones_like(x)
+        d : np.ndarray = 1 - (a + b) * x / (a + 1)
+        d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+        f : np.ndarray = d.copy()
+        for m in range(1, 200):
+            for num in (m * (b - m) * x / ((a + 2*m - 1) * (a + 2*m)),
+                        -(a + m) * (a + b + m) * x / ((a + 2*m) * (a + 2*m + 1))):
+                d = 1 + num * d
+                d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+                c = 1 + num / c
+                c = np.where(np.abs(c) < tiny, tiny, c)
+                f *= c * d
+
+        result : np.ndarray = np.where(x > 0, front * f, 0.0)
+
+    return np.where(swap, 1 - result, result)
+
+
+def t_pvalue(t : np.ndarray, df : np.ndarray) -> np.ndarray:
+    """Two sided p-value of the Student t distribution."""
+    t, df = np.asarray(t, dtype=float), np.asarray(df, dtype=float)
+    return betainc(df / 2, 0.5, df / (df + t**2))
+
+
+def t_quantile(alpha : float, df : np.ndarray) -> np.ndarray:
+    """Two sided critical value, t with t_pvalue(t, df) == alpha, by bisection."""
+    df = np.asarray(df, dtype=float)
+    low : np.ndarray = np.zeros_like(df)
+    high : np.ndarray = np.full_like(df, 1e4)
+    for _ in range(80):
+        mid : np.ndarray = (low + high) / 2
+        above : np.ndarray = t_pvalue(mid, df) > alpha
+        low, high = np.where(above, mid, low), np.where(above, high, mid)
+    return np.where(np.isnan(df), np.nan, (low + high) / 2)
+
+
+def pool(dt : pd.DataFrame, by : list[str], metric : str) -> pd.DataFrame:
+    """Merge the rows with the same by values in a single mean, stdev and count."""
+    n : pd.Series = dt['executions'].astype(float)
+    mean : pd.Series = dt[metric]
+    stdev : pd.Series = dt[metric + '_stdev']
+
+    sums : pd.DataFrame = pd.DataFrame({
+        'n' : n,
+        'sum' : n * mean,
+        'squares' : (n - 1) * stdev**2 + n * mean**2,
+    }).groupby([dt[col] for col in by]).sum()
+
+    result : pd.DataFrame = pd.DataFrame(index=sums.index)
+    result['n'] = sums['n']
+    result['mean'] = sums['sum'] / sums['n']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance : pd.Series = (sums['squares'] - sums['n'] * result['mean']**2) / (sums['n'] - 1)
+    result['stdev'] = np.sqrt(variance.clip(lower=0))
+    return result
+
+
+def to_table(data : Dict[str, pd.DataFrame], keys : list[str], metric : str) -> pd.DataFrame:
+    """All the experiments in one table with pooled metric by key and keys."""
+    tables : list[pd.DataFrame] = []
+    for key, dt in data.items():
+        by : list[str] = [col for col in keys if col in dt.columns]
+        table : pd.DataFrame = pool(dt, by, metric).reset_index()
+        table.insert(0, 'key', key)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+def compare(baseline : pd.DataFrame, candidate : pd.DataFrame, by : list[str],
+            alpha : float = 0.05, threshold : float = 0.05) -> pd.DataFrame:
+    """Welch's t-test of every matching row of two to_table tables.
+
+    change is candidate / baseline - 1 with its 1 - alpha confidence
+    interval, effect is Cohen's d with the average variance. A row is a
+    regression (improvement) when the difference is significant and the
+    candidate is more than threshold slower (faster). Rows with less than
+    two executions or no variance on both sides get NaN p-values and are
+    never flagged.
+    """
+    dt : pd.DataFrame = baseline.merge(candidate, on=by, suffixes=('_base', '_cand'))
+
+    n1, m1, s1 = dt['n_base'], dt['mean_base'], dt['stdev_base']
+    n2, m2, s2 = dt['n_cand'], dt['mean_cand'], dt['stdev_cand']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v1 : pd.Series = s1**2 / n1
+        v2 : pd.Series = s2**2 / n2
+        se : pd.Series = np.sqrt(v1 + v2)
+        df : pd.Series = (v1 + v2)**2 / (v1**2 / (n1 - 1) + v2**2 / (n2 - 1))
+        df = df.where((n1 > 1) & (n2 > 1) & (se > 0))
+
+        dt['t'] = (m2 - m1) / se
+        dt['df'] = df
+        dt['pvalue'] = t_pvalue(dt['t'], df)
+
+        margin : pd.Series = t_quantile(alpha, df) * se
+        dt['change'] = m2 / m1 - 1
+        dt['change_low'] = (m2 - m1 - margin) / m1
+        dt['change_high'] = (m2 - m1 + margin) / m1
+        dt['effect'] = (m2 - m1) / np.sqrt((s1**2 + s2**2) / 2)
+
+    significant : pd.Series = dt['pvalue'] < alpha
+    dt['status'] = np.select([significant & (dt['change'] > threshold),
+                              significant & (dt['change'] < -threshold)],
+                             ['regression', 'improvement'], '')
+    return dt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two campaigns and detect regressions.")
+    parser.add_argument("baseline", help="json with the baseline results")
+    parser.add_argument("candidate", help="json with the candidate results")
+    parser.add_argument("--metric", default="Algorithm_time",
+                        help="time to compare, with its _stdev (default: Algorithm_time)")
+    parser.add_argument("--keys", nargs="+",
+                        default=['Rows', 'Tasksize', 'cpu_count', 'worldsize', 'namespace_enabled'],
+                        help="columns that identify a configuration, when present")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="significance level of the tests and the intervals (default: 0.05)")
+    parser.add_argument("--threshold", type=float, default=0.05,
+                        help="relative slowdown reported as a regression (default: 0.05)")
+    parser.add_argument("-o", "--output", default="compare.csv",
+                        help="csv with all the comparisons (default: compare.csv)")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="directory to cache the imported json files")
+    args = parser.parse_args()
+
+    baseline : pd.DataFrame = to_table(gr.import_json_list([args.baseline], args.cache),
+                                       args.keys, args.metric)
+    candidate : pd.DataFrame = to_table(gr.import_json_list([args.candidate], args.cache),
+                                        args.keys, args.metric)
+
+    by : list[str] = ['key'] + [col for col in args.keys
+                                if col in baseline.columns and col in candidate.columns]
+    result : pd.DataFrame = compare(baseline, candidate, by, args.alpha, args.threshold)
+    result.to_csv(args.output, index = False)
+    print("Generated:", args.output)
+
+    unmatched : int = len(baseline) + len(candidate) - 2 * len(result)
+    if unmatched:
+        print("Ignoring:", unmatched, "rows without a match in the other file", file = sys.stderr)
+    if result.empty:
+        sys.exit("No configuration matches between " + args.baseline + " and " + args.candidate)
+
+    untested : int = result['df'].isna().sum()
+    if untested == len(result):
+        sys.exit("No configuration could be tested, all have less than two executions"
+                 " or no variance")
+    if untested:
+        print("Warning:", untested, "rows not tested, with less than two executions"
+              " or no variance", file = sys.stderr)
+
+    print("Compared:", len(result) - untested, "improvements:", (result['status'] == 'improvement').sum(),
+          "regressions:", (result['status'] == 'regression').sum())
+
+    regressions : pd.DataFrame = result[result['status'] == 'regression']
+    if not regressions.empty:
+        print(regressions.filter(by + ['mean_base', 'mean_cand', 'change',
+                                       'change_low', 'change_high', 'pvalue', 'effect'], axis=1))
+        sys.exit(1)
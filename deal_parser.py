@@ -1,7 +1,12 @@
 #/bin/env python3
 
 import os, sys
-from typing import Dict, TextIO, Pattern, TypeAlias
+import time
+import warnings
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, TextIO, Pattern, TypeAlias, NamedTuple
 import json
 from tabulate import tabulate
 import pandas as pd
@@ -10,11 +15,173 @@ import re
 import numpy as np
 import matplotlib.pyplot as plt
 
+try:
+    import orjson
+
+    def loadJson(filename: str) -> Dict:
+        """Load a json file, with orjson when available."""
+        with open(filename, "rb") as fin:
+            return orjson.loads(fin.read())
+except ImportError:
+    def loadJson(filename: str) -> Dict:
+        """Load a json file, with orjson when available."""
+        with open(filename) as fin:
+            return json.load(fin)
+
+class JsonSubtreeReader:
+    """Incremental reader that only builds some top level entries of a json.
+
+    The file is read in chunks of chunk_size. The values of the wanted keys
+    are collected and parsed, every other value is skipped with a token
+    regex without keeping it in memory, and the reading stops when all the
+    wanted keys were found. So the memory is a chunk plus the size of the
+    wanted subtrees, not of the whole document. The strings and scalars
+    that span several chunks are scanned from where the previous chunk
+    ended, so the time is linear in the size of the file.
+    """
+
+    re_space: Pattern[str] = re.compile(r"\s*")
+    # The rest of a string, up to its closing quote or a trailing backslash
+    re_string_body: Pattern[str] = re.compile(r'[^"\\]*+(?:\\.[^"\\]*+)*+', re.DOTALL)
+    # Only the brackets and the strings (that may contain brackets) matter to
+    # skip, a lone quote is a string that doesn't end in the buffer
+    re_token: Pattern[str] = re.compile(r'"[^"\\]*+(?:\\.[^"\\]*+)*+"|[{}\[\]]|"', re.DOTALL)
+    re_scalar_end: Pattern[str] = re.compile(r"[,}\]\s]")
+
+    def __init__(self, fin: TextIO, chunk_size: int = 1 << 20):
+        self.fin: TextIO = fin
+        self.chunk_size: int = chunk_size
+        self.buf: str = ""
+        self.pos: int = 0
+        self.start: int | None = None    # start of the value being captured
+        self.captured: list[str] = []    # parts of the value from previous chunks
+
+    def _more(self) -> None:
+        """Read the next chunk, dropping what is already consumed."""
+        chunk: str = self.fin.read(self.chunk_size)
+        if not chunk:
+            raise ValueError("Truncated json input")
+        if self.start is not None:
+            self.captured.append(self.buf[self.start:self.pos])
+            self.start = 0
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def _capture(self) -> str:
+        """Stop capturing and get the text from the capture start to pos."""
+        text: str = "".join(self.captured) + self.buf[self.start:self.pos]
+        self.captured = []
+        self.start = None
+        return text
+
+    def _peek(self) -> str:
+        """Skip the white spaces and get the next character."""
+        while True:
+            self.pos = self.re_space.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self._more()
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' at json offset {self.pos}")
+        self.pos += 1
+
+    def _skipString(self) -> None:
+        """Move pos after the string whose opening quote is at pos."""
+        self.pos += 1
+        while True:
+            self.pos = self.re_string_body.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) and self.buf[self.pos] == '"':
+                self.pos += 1
+                return
+            self._more()
+
+    def _string(self) -> str:
+        if self._peek() != '"':
+            raise ValueError(f"Expected a string at json offset {self.pos}")
+        self.start = self.pos
+        self._skipString()
+        return json.loads(self._capture())
+
+    def _skip(self) -> None:
+        """Move pos after the value starting at pos."""
+        if self._peek() not in '{["':
+            # Scalars end at the next separator
+            while not (match := self.re_scalar_end.search(self.buf, self.pos)):
+                self.pos = len(self.buf)
+                self._more()
+            self.pos = match.start()
+            return
+
+        depth: int = 0
+        while True:
+            for match in self.re_token.finditer(self.buf, self.pos):
+                token: str = match.group()
+                if token == '"':
+                    # A string that continues in the next chunks
+                    self.pos = match.start()
+                    self._skipString()
+                    if depth == 0:
+                        return
+                    break
+                if token[0] != '"':
+                    depth += 1 if token in "{[" else -1
+                if depth == 0:
+                    self.pos = match.end()
+                    return
+            else:
+                self.pos = len(self.buf)
+                self._more()
+
+    def read(self, keys: tuple) -> Dict:
+        """Get {key: value} for the keys at the top level of the document."""
+        result: Dict = {}
+        self._expect("{")
+        if self._peek() == "}":
+            return result
+
+        while True:
+            key: str = self._string()
+            self._expect(":")
+
+            if key in keys:
+                self._peek()
+                self.start = self.pos
+                self._skip()
+                result[key] = json.loads(self._capture())
+                if len(result) == len(keys):
+                    return result   # Don't read the rest
+            else:
+                self._skip()
+
+            if self._peek() == "}":
+                return result
+            self._expect(",")
+
+def loadJsonSubtrees(filename: str, keys: tuple) -> Dict:
+    """Load only the top level keys of a json file, see JsonSubtreeReader."""
+    with open(filename) as fin:
+        return JsonSubtreeReader(fin).read(keys)
+
 TIME_UNITS: Dict[str,float] = {"us": 1.E-6, "ms": 1.E-3, "s": 1, "m": 60, "h": 3600, "d": 86400}
 
 re_result: Pattern[str] = re.compile(r"\S+//?(\S*?)_result(?:_\d+)?\.json")
-re_external: Pattern[str] = re.compile(r"# Command:.*?-o " + re_result.pattern + r".*?Total execution time: (\S+s)", re.DOTALL)
-
+re_repeat: Pattern[str] = re.compile(r"_result_(\d+)\.json$")
+re_command: Pattern[str] = re.compile(r"# Command:.*? -o (" + re_result.pattern + ")")
+# The file name of an output in any line, with or without directory
+re_output: Pattern[str] = re.compile(r"[^\s\"'()\[\]<>,;:/\\]+_result(?:_\d+)?\.json")
+re_total_time: Pattern[str] = re.compile(r"Total execution time: (\S+s)")
+# First line of every run in the log: the old loop and grid_runner headers
+re_log_header: Pattern[str] = re.compile(r"# (?:Before \(default\)|executable: )")
+# The old loop with -p, its jobs run in the background
+re_log_parallel: Pattern[str] = re.compile(r"#\s+(?:p|parallel): true\s*$|# Waiting jobs:")
+
+
+def isWarmup(filename: str, warmup: int) -> bool:
+    """If filename is the output of one of the first warmup repeats."""
+    matches = re_repeat.search(filename)
+    return bool(matches) and int(matches.group(1)) < warmup
 
 def translateStrToTime(pvalue : str) -> float:
     matches = re.match(r"([\d\.]+)(us|ms|s|m|h|d)", pvalue)
@@ -49,12 +216,15 @@ def processAttributes(attr : Dict) -> float | int:
     ret["response"] = processEntry(attr["response_payload_size_total"])
     return ret
 
+class MissingEntry(Exception):
+    """A path step that is not in the tree."""
+
 def getAttrValue(arr, *argv) -> Dict | list | float:
     arrIt = arr
     for key in argv:
         if isinstance(arrIt, dict):
             if key not in arrIt:
-                raise Exception(f"Sorry, no key:{key} in dict.")
+                raise MissingEntry(f"Sorry, no key:{key} in dict.")
             arrIt = arrIt[key]
 
         elif isinstance(arrIt, list):
@@ -63,7 +233,7 @@ def getAttrValue(arr, *argv) -> Dict | list | float:
                     arrIt = entry
                     break
             else:
-                raise Exception(f"Sorry, no entry with name:{key} in list.")
+                raise MissingEntry(f"Sorry, no entry with name:{key} in list.")
         else:
             raise Exception(f"Entry is an invalid type: {type(arrIt)}.")
 
@@ -75,147 +245,620 @@ def getAttrValue(arr, *argv) -> Dict | list | float:
 
     return arrIt;
 
-def process_file(jsondata: Dict) -> Dict[str, float] | None:
-    result: Dict = {}
+def indexEntries(arr: list) -> Dict:
+    """Index a list of named entries by name, the first entry with a name wins."""
+    return {entry["name"]: entry for entry in reversed(arr)}
 
+class MetricPath(NamedTuple):
+    """A metric to extract: name, "key/key/..." path and if it must exist."""
+    name: str
+    path: str
+    required: bool = True
+
+# Default extraction spec for the Valuate responses.
+valuate: str = "time_record/children/Valuate/children/"
+heston_corr: str = valuate + "HestonTotal/children/HestonCorr/children/Valuate/children/HestonCorr/children/"
+
+metric_spec: list[MetricPath] = [
+    # These fields are only in callable outputs
+    MetricPath("Sampling", valuate + "CallableSampling/span/duration", False),
+    MetricPath("SamplingLV", valuate + "CallableSampling/children/LOCAL_VOL_VALUATION/span/duration", False),
+    MetricPath("SamplingHV", valuate + "CallableSampling/children/HESTON_VOL_VALUATION/span/duration", False),
+    MetricPath("SamplingSV", valuate + "CallableSampling/children/LOCAL_STOCH_VOL_VALUATION/span/duration", False),
+    MetricPath("Regressors", valuate + "Regressors/span/duration", False),
+
+    MetricPath("HestonTotal", valuate + "HestonTotal/span/duration"),
+    MetricPath("HestonLV", valuate + "HestonTotal/children/LOCAL_VOL_VALUATION/span/duration"),
+    MetricPath("HestonV", heston_corr + "HESTON_VOL_VALUATION/span/duration"),
+    MetricPath("HestonSV", heston_corr + "LOCAL_STOCH_VOL_VALUATION/span/duration"),
+
+    MetricPath("Total Internal", "time_record/span/duration"),
+]
+
+def loadSpec(filename: str) -> list[MetricPath]:
+    """Read a spec from a json list of {"name": ..., "path": ..., "required": ...}."""
+    with open(filename) as fin:
+        return [MetricPath(entry["name"], entry["path"], entry.get("required", True))
+                for entry in json.load(fin)]
+
+PathTree: TypeAlias = tuple  # (names, [(keys, PathTree), ...], names in subtree, required)
+
+class MetricExtractor:
+    """Matcher compiled from a metric spec, extract walks each tree once.
+
+    The paths are merged in a tree, so the common steps are resolved only
+    once, and chains without branches are resolved with a single
+    getAttrValue call. Every visited children list with more than one
+    requested entry is indexed by name once, then all the lookups in it are
+    O(1). Missing optional metrics are left out of the result, missing
+    required ones raise.
+
+    The time spent in every step is added to all the metrics below it,
+    report prints it with the hits and misses of every metric.
+    """
+
+    def __init__(self, spec: list[MetricPath]):
+        self.spec: list[MetricPath] = spec
+
+        trie: Dict = {}
+        for metric in spec:
+            node = trie
+            for key in metric.path.split("/"):
+                node = node.setdefault(key, {})
+            node.setdefault(None, []).append(metric)
+
+        self.tree: PathTree = self._compress(trie)
+
+        self.times: Dict[str, float] = {metric.name: 0.0 for metric in spec}
+        self.hits: Dict[str, int] = {metric.name: 0 for metric in spec}
+        self.misses: Dict[str, int] = {metric.name: 0 for metric in spec}
+
+    def _compress(self, node: Dict) -> PathTree:
+        edges: list = []
+        for key, child in node.items():
+            if key is None:
+                continue
+            keys: tuple = (key,)
+            while None not in child and len(child) == 1:
+                (key, child), = child.items()
+                keys += (key,)
+            edges.append((keys, self._compress(child)))
+
+        metrics: list[MetricPath] = node.get(None, [])
+        names: list[str] = [metric.name for metric in metrics]
+        subtree: list[str] = names + [name for _, child in edges for name in child[2]]
+        required: bool = any(metric.required for metric in metrics) \
+            or any(child[3] for _, child in edges)
+        return (names, edges, subtree, required)
+
+    def extract(self, jsondata: Dict) -> Dict[str, Dict | list | float]:
+        """Get all the metrics in jsondata, in the order of the spec."""
+        result: Dict[str, Dict | list | float] = {}
+        self._walk(self.tree, jsondata, result)
+
+        for metric in self.spec:
+            if metric.name in result:
+                self.hits[metric.name] += 1
+            else:
+                self.misses[metric.name] += 1
+
+        return {metric.name: result[metric.name] for metric in self.spec if metric.name in result}
+
+    def _walk(self, tree: PathTree, arrIt, result: Dict) -> None:
+        names, edges, _, _ = tree
+        for name in names:
+            result[name] = arrIt
+
+        # A single edge is cheaper with the scan in getAttrValue
+        if isinstance(arrIt, list) and len(edges) > 1:
+            arrIt = indexEntries(arrIt)
+
+        for keys, child in edges:
+            start: float = time.perf_counter()
+            try:
+                value = getAttrValue(arrIt, *keys)
+            except MissingEntry:
+                if child[3]:
+                    raise
+                continue
+            finally:
+                elapsed: float = time.perf_counter() - start
+                for name in child[2]:
+                    self.times[name] += elapsed
+
+            if isinstance(value, (dict, list)):
+                self._walk(child, value, result)
+            else:
+                # getAttrValue returned a converted value, as for the full paths.
+                for name in child[2]:
+                    result[name] = value
+
+    def takeStats(self) -> tuple:
+        """Get the counters and reset them."""
+        stats: tuple = (self.times, self.hits, self.misses)
+        self.times = dict.fromkeys(self.times, 0.0)
+        self.hits = dict.fromkeys(self.hits, 0)
+        self.misses = dict.fromkeys(self.misses, 0)
+        return stats
+
+    def addStats(self, stats: tuple) -> None:
+        """Add back the counters got with takeStats, here or in a worker."""
+        for mine, other in zip((self.times, self.hits, self.misses), stats):
+            for name, value in other.items():
+                mine[name] += value
+
+    def report(self, file: TextIO = sys.stdout) -> None:
+        """Print the time, hits and misses per metric."""
+        table: list = [[metric.name, metric.path, self.hits[metric.name], self.misses[metric.name],
+                        self.times[metric.name] * 1E3]
+                       for metric in self.spec]
+        print(tabulate(table, headers=["Metric", "Path", "Hits", "Misses", "Time (ms)"],
+                       tablefmt='psql'), file = file)
+
+extractor: MetricExtractor = MetricExtractor(metric_spec)
+
+def process_file(jsondata: Dict) -> Dict[str, float] | None:
     # Check first the status code
     status_code: str = getAttrValue(jsondata, "status", "code")
     if (status_code != 'OK'):
         print(f"Output failed with code: {status_code}", file = sys.stderr)
         return
 
-    # base is a sort of shortcut reference. It will be moved to simplify latter
-    # also shorter path implies a more efficient getAttrValue
-    base = getAttrValue(jsondata, "time_record", "children", "Valuate", "children")
-    assert base
-    # These fields are only in callable outputs
-    if any(x["name"] == "CallableSampling" for x in base):
-        result["Sampling"] = getAttrValue(base, "CallableSampling", "span", "duration")
+    # All the metrics in a single traversal
+    return extractor.extract(jsondata)
 
-        result["SamplingLV"] = getAttrValue(base, "CallableSampling", "children", "LOCAL_VOL_VALUATION", "span", "duration")
-        result["SamplingHV"] = getAttrValue(base, "CallableSampling", "children", "HESTON_VOL_VALUATION", "span", "duration")
-        result["SamplingSV"] = getAttrValue(base, "CallableSampling", "children", "LOCAL_STOCH_VOL_VALUATION", "span", "duration")
+class MyDict:
+    """Samples of every metric, stored as the columns of a float array.
 
-        result["Regressors"] = getAttrValue(base, "Regressors", "span", "duration")
+    The array is preallocated and doubles when full, so appending a value is
+    amortized O(1) and the samples are never boxed. Every column is filled
+    from the top and the rows after its size are NaN, so the statistics of
+    all the metrics are a single nan* reduction over the rows.
+    """
 
-    # Move reference
-    base = getAttrValue(base, "HestonTotal")
-    result["HestonTotal"] = getAttrValue(base, "span", "duration")
+    def __init__(self, arg1: Dict[str, float] | None = None, capacity: int = 8):
+        self.columns: Dict[str, int] = {}
+        self.sizes: list[int] = []
+        self.data: np.ndarray = np.full((capacity, capacity), np.nan)
+        if (arg1):
+            self.appendDict(arg1)
 
-    result["HestonLV"] = getAttrValue(base, "children", "LOCAL_VOL_VALUATION", "span", "duration")
+    def _reserve(self, rows: int, cols: int) -> None:
+        """Make room for rows x cols samples, doubling the array."""
+        oldrows, oldcols = self.data.shape
+        if rows <= oldrows and cols <= oldcols:
+            return
+        if rows > oldrows:
+            rows = max(rows, 2 * oldrows)
+        if cols > oldcols:
+            cols = max(cols, 2 * oldcols)
+
+        data: np.ndarray = np.full((max(rows, oldrows), max(cols, oldcols)), np.nan)
+        data[:oldrows, :oldcols] = self.data
+        self.data = data
+
+    def _column(self, key: str) -> int:
+        col: int | None = self.columns.get(key)
+        if col is None:
+            col = len(self.columns)
+            self._reserve(0, col + 1)
+            self.columns[key] = col
+            self.sizes.append(0)
+        return col
 
-    # Move reference
-    base = getAttrValue(base, "children", "HestonCorr", "children", "Valuate", "children", "HestonCorr", "children")
+    def appendDict(self, arg1: Dict[str, float]) -> None:
+        for key, value in arg1.items():
+            self.appendValue(key, value)
 
-    result["HestonV"] = getAttrValue(base, "HESTON_VOL_VALUATION",  "span", "duration")
-    result["HestonSV"] = getAttrValue(base, "LOCAL_STOCH_VOL_VALUATION", "span", "duration")
+    def appendValue(self, key: str, value: float) -> None:
+        col: int = self._column(key)
+        row: int = self.sizes[col]
+        self._reserve(row + 1, 0)
+        self.data[row, col] = value
+        self.sizes[col] = row + 1
 
-    result["Total Internal"] = getAttrValue(jsondata, "time_record", "span", "duration")
+    def __setitem__(self, key: str, value) -> None:
+        assert key not in self.columns
+        col: int = self._column(key)
+        self._reserve(len(value), 0)
+        self.data[:len(value), col] = value
+        self.sizes[col] = len(value)
 
-    return result
+    def __getitem__(self, key: str) -> np.ndarray:
+        col: int = self.columns[key]
+        return self.data[:self.sizes[col], col]
 
-class MyDict(dict):
+    def __contains__(self, key: str) -> bool:
+        return key in self.columns
 
-    def __init__(self, arg1: Dict[str, float] | None = None):
-        if (arg1):
-            self.appendDict(arg1)
+    def __len__(self) -> int:
+        return len(self.columns)
 
-    def appendDict(self, arg1: Dict[str, float]) -> None:
-        for key, value in arg1.items():
-            self.appendValue(key, value)
+    def keys(self):
+        return self.columns.keys()
 
-    def appendValue(self, key: str, value: float) -> None:
-        if key not in self:
-            super().__setitem__(key, [value])
-        else:
-            super().__getitem__(key).append(value)
+    def items(self):
+        return ((key, self[key]) for key in self.columns)
+
+    def samples(self) -> np.ndarray:
+        """The (samples, metrics) view of the array, NaN where a metric has less samples."""
+        return self.data[:max(self.sizes, default=0), :len(self.columns)]
+
+    def toFrame(self) -> pd.DataFrame:
+        """The samples as a DataFrame with a column per metric."""
+        return pd.DataFrame(self.samples(), columns=list(self.columns))
+
+    # Statistics of all the metrics at once, in the order of columns
+    def mean(self) -> np.ndarray:
+        return np.nanmean(self.samples(), axis=0)
 
-    def __setitem__(self, key: str, value: list[float]) -> None:
-        assert key not in self
-        super().__setitem__(key, value)
+    def std(self) -> np.ndarray:
+        """Sample standard deviation (ddof=1), NaN with a single sample."""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanstd(self.samples(), axis=0, ddof=1)
+
+    def min(self) -> np.ndarray:
+        return np.nanmin(self.samples(), axis=0)
+
+    def max(self) -> np.ndarray:
+        return np.nanmax(self.samples(), axis=0)
+
+    def median(self) -> np.ndarray:
+        return np.nanmedian(self.samples(), axis=0)
+
+    def percentile(self, q: float | list[float]) -> np.ndarray:
+        return np.nanpercentile(self.samples(), q, axis=0)
 
     def getmeans(self) -> Dict[str, float]:
-        return {subkey: np.mean(sublist) for subkey, sublist in self.items()}
+        return dict(zip(self.columns, self.mean()))
 
     @staticmethod
-    def parseLogFile(logfile: TextIO):
-        """Parse the logfile to get the user times"""
-        content: str = logfile.read()
-        matches = re.findall(re_external, content)
-
+    def parseLogFile(logfile: TextIO, warmup: int = 0):
+        """Parse the logfile to get the user times of the repeats >= warmup.
+
+        Single pass over the lines: every "# Command:" opens a job for its
+        output file and every "Total execution time" closes one. Every run
+        appended to the log starts with its arguments header, only the runs
+        of the old loop with -p interleave the outputs of their jobs: its
+        header says so, or two commands follow each other without output.
+        Else a new command means the previous job ended without a time (it
+        crashed or timed out), so it is dropped. A line with the output file of an
+        open job makes it the current one; a time goes to the current job,
+        or to the most recent open job when no line identified it.
+        """
         user_times = MyDict()
-        for match in matches:
-            print(match)
-            user_times.appendValue(match[0], translateStrToTime(match[1]))
+        running: Dict[str, str] = {}    # output file name -> key, in launch order
+        current: str | None = None
+        parallel: bool = False
+        quiet: bool = False             # no output since the last command
+
+        def dropRunning() -> None:
+            for output in running:
+                print(f"No time for {output}, the job didn't finish", file = sys.stderr)
+            running.clear()
+
+        for line in logfile:
+            if line.startswith("# "):
+                if line.startswith("# Command:"):
+                    parallel = parallel or (quiet and bool(running))
+                    if not parallel:
+                        dropRunning()
+                        current = None
+                    quiet = True
+                    if matches := re_command.match(line):
+                        running[os.path.basename(matches.group(1))] = matches.group(2)
+                    continue
+                if re_log_header.match(line):
+                    dropRunning()
+                    current = None
+                    parallel = False
+                    continue
+                if re_log_parallel.match(line):
+                    parallel = True
+                    continue
+
+            quiet = False
+            if "_result" in line and (matches := re_output.search(line)):
+                if matches.group() in running:
+                    current = matches.group()
+
+            if "Total execution time" not in line or not running:
+                continue
+            if not (matches := re_total_time.search(line)):
+                continue
+
+            output: str = current if current else next(reversed(running))
+            key: str = running.pop(output)
+            current = None
+            if isWarmup(output, warmup):
+                continue
+
+            print((key, matches.group(1)))
+            user_times.appendValue(key, translateStrToTime(matches.group(1)))
 
         return user_times
 
 Container: TypeAlias = Dict[str, MyDict]
 
+def summarize(samples: np.ndarray, trim: float = 0.1, confidence: float = 0.95,
+              nboot: int = 1000, seed: int = 0) -> Dict[str, np.ndarray]:
+    """Robust statistics of (keys, repeats, metrics) samples over the repeats.
+
+    The samples of every (key, metric) are at the top of the repeats axis
+    and NaN after them, as in MyDict. All the statistics are computed for all
+    the keys and metrics at once, each one is a (keys, metrics) array:
+    n, mean, std, min, p50, p90, p99, max, the trimmed mean (trim of the
+    samples cut at each end) and the bootstrap confidence interval of the
+    mean with nboot resamples.
+    """
+    nkeys, nrows, nmetrics = samples.shape
+    counts: np.ndarray = np.sum(~np.isnan(samples), axis=1)
+    rank: np.ndarray = np.arange(nrows)[None, :, None]
+    stats: Dict[str, np.ndarray] = {"n": counts}
+
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        stats["mean"] = np.nanmean(samples, axis=1)
+        stats["std"] = np.nanstd(samples, axis=1, ddof=1)
+        stats["min"] = np.nanmin(samples, axis=1)
+        for q, value in zip((50, 90, 99), np.nanpercentile(samples, (50, 90, 99), axis=1)):
+            stats[f"p{q}"] = value
+        stats["max"] = np.nanmax(samples, axis=1)
+
+        # NaN sort last, so the kept ranks are [cut, n - cut)
+        cut: np.ndarray = np.floor(counts * trim).astype(int)[:, None, :]
+        kept: np.ndarray = (rank >= cut) & (rank < counts[:, None, :] - cut)
+        stats["trimmed_mean"] = np.sum(np.sort(samples, axis=1), axis=1, where=kept) \
+            / np.sum(kept, axis=1)
+
+        # Resample the n samples of every (key, metric), in batches to bound the memory
+        rng: np.random.Generator = np.random.default_rng(seed)
+        valid: np.ndarray = rank < counts[:, None, :]
+        batch: int = max(1, (1 << 22) // max(1, samples.size))
+        means: list[np.ndarray] = []
+        for start in range(0, nboot, batch):
+            size: int = min(batch, nboot - start)
+            picks: np.ndarray = (rng.random((size,) + samples.shape) * counts[:, None, :]).astype(int)
+            resampled: np.ndarray = np.take_along_axis(samples[None], picks, axis=2)
+            means.append(np.sum(resampled, axis=2, where=valid) / counts)
+        alpha: float = (1 - confidence) / 2
+        low, high = np.quantile(np.concatenate(means), (alpha, 1 - alpha), axis=0)
+        stats["ci_low"] = low
+        stats["ci_high"] = high
+
+    return stats
+
+# When set, only these top level entries of the result files are read.
+stream_keys: tuple | None = None
+
+def processResult(filename: str) -> tuple:
+    """Load and process a result file: (data, stats, error).
+
+    data is None when the output failed, error is set when the file can't be
+    read or processed. It runs in the worker processes too, stats are the
+    extractor counters for this file to merge them in the main process.
+    """
+    try:
+        if stream_keys:
+            jsondata: Dict = loadJsonSubtrees(filename, stream_keys)
+        else:
+            jsondata: Dict = loadJson(filename)
+    except IOError:
+        return None, None, f"Couldn't open input:{filename}"
+    except ValueError as error:
+        return None, None, f"Couldn't parse input:{filename}: {error}"
+
+    try:
+        datai: Dict[str, float] | None = process_file(jsondata)
+    except (MissingEntry, ValueError, KeyError, TypeError) as error:
+        return None, extractor.takeStats(), f"Couldn't process input:{filename}: {error}"
+    return datai, extractor.takeStats(), None
+
+def _initWorker(spec: list[MetricPath], keys: tuple | None) -> None:
+    """Use the same metric spec and reader as the main process."""
+    global extractor, stream_keys
+    extractor = MetricExtractor(spec)
+    stream_keys = keys
+
+def loadManifest(filename: str) -> Dict[str, Dict]:
+    """Read a grid_runner manifest.jsonl: {output file name: record}.
+
+    When a job was run again (--resume) its last record wins.
+    """
+    records: Dict[str, Dict] = {}
+    with open(filename) as fin:
+        for line in fin:
+            if line.strip():
+                record: Dict = json.loads(line)
+                records[os.path.basename(record["output"])] = record
+    return records
+
 class MyTable(dict):
     @staticmethod
-    def processMultiple(jsonfiles: list[str], logfilename: str) -> Container:
+    def processMultiple(jsonfiles: list[str], logfilename: str, njobs: int | None = None,
+                        warmup: int = 0, manifestfilename: str | None = None) -> Container:
+        """Process the result files in njobs processes (default: all cores).
+
+        The first warmup repeats of every input (_result_<i> with i < warmup)
+        are not read. The "Total User" time of every result comes from its
+        record in the manifest when there is one, else from the logfile.
+        """
         result: Container = {}
 
-        # read the json_result files
+        # Check the names first, the files are processed in parallel
+        valid: list[tuple[str, str]] = []
+        dropped: int = 0
         for filename in jsonfiles:
             if os.path.isfile(filename):
                 matches = re.match(re_result, filename)
                 if not matches:
                     print(f"Filename:{filename} does not match regex", file = sys.stderr)
                     continue
-                key: str = matches.group(1)
-                print(f"Processing {filename} -> {key}")
-                try:
-                    with open(filename) as fin:
-                        jsondata: Dict = json.load(fin)
-                        datai: Dict[str, float] | None = process_file(jsondata)
-                        if key not in result:
-                            print(f"Adding new key: {key}")
-                            result[key] = MyDict()
-
-                        if not datai:
-                            print(f"Output file {filename} failed", file = sys.stderr)
-                            continue
-
-                        result[key].appendDict(datai)
-                except IOError:
-                    print(f"Couldn't open input:{filename}", file = sys.stderr)
+                if isWarmup(filename, warmup):
+                    dropped += 1
+                    continue
+                valid.append((filename, matches.group(1)))
             else:
                 print(f"Path: '{filename}' is not a file", file = sys.stderr)
 
-        # Readlog to get the user times
-        if os.path.isfile(logfilename):
-            with open(logfilename) as logfile:
-                user_times: Dict[str, list[float]] = MyDict.parseLogFile(logfile)
+        if dropped:
+            print(f"Dropped {dropped} warm-up results")
+
+        manifest: Dict[str, Dict] | None = None
+        if manifestfilename and os.path.isfile(manifestfilename):
+            manifest = loadManifest(manifestfilename)
 
-                for key, value in user_times.items():
-                    if key in result:
-                        result[key]["Total User"] = value
+        filenames: list[str] = [filename for filename, _ in valid]
+        workers: int = njobs or os.cpu_count() or 1
+        executor: ProcessPoolExecutor | None = None
+        if workers != 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                                           initargs=(extractor.spec, stream_keys))
+
+        with executor or contextlib.nullcontext():
+            if executor:
+                chunksize: int = max(1, len(filenames) // (4 * workers))
+                outputs = executor.map(processResult, filenames, chunksize=chunksize)
+            else:
+                outputs = map(processResult, filenames)
+
+            # read the json_result files, merging them in the input order
+            for (filename, key), (datai, stats, error) in zip(valid, outputs):
+                print(f"Processing {filename} -> {key}")
+                # processResult takes the counters, in this process too
+                if stats:
+                    extractor.addStats(stats)
+
+                if error:
+                    print(error, file = sys.stderr)
+                    continue
+
+                if key not in result:
+                    print(f"Adding new key: {key}")
+                    result[key] = MyDict()
+
+                if not datai:
+                    print(f"Output file {filename} failed", file = sys.stderr)
+                    continue
+
+                result[key].appendDict(datai)
+
+                if manifest is not None:
+                    # wall is monotonic, records of interrupted runs have no returncode
+                    record: Dict | None = manifest.get(os.path.basename(filename))
+                    if record is None or record.get("returncode") != 0 or "wall" not in record:
+                        print(f"No successful run of {filename} in the manifest", file = sys.stderr)
                     else:
-                        print(f"No key: {key} in data indices {list(result.keys())}")
-        else:
-            print(f"No logfile found {logfilename}")
+                        result[key].appendValue("Total User", record["wall"])
+
+        # Readlog to get the user times, when there is no manifest
+        if manifest is None:
+            if os.path.isfile(logfilename):
+                with open(logfilename) as logfile:
+                    user_times: Dict[str, list[float]] = MyDict.parseLogFile(logfile, warmup)
+
+                    for key, value in user_times.items():
+                        if key in result:
+                            result[key]["Total User"] = value
+                        else:
+                            print(f"No key: {key} in data indices {list(result.keys())}")
+            else:
+                print(f"No logfile found {logfilename}")
 
         return result
 
 
-    def __init__(self, jsonfiles: list[str], logfilename: str):
-        super().update(MyTable.processMultiple(jsonfiles, logfilename))
-
-    def toTable(self) -> pd.DataFrame:
-        return pd.DataFrame.from_dict(
-            { key: submap.getmeans() for key, submap in self.items() },
-            orient="index"
-        )
+    def __init__(self, jsonfiles: list[str], logfilename: str, njobs: int | None = None,
+                 warmup: int = 0, manifestfilename: str | None = None):
+        super().update(MyTable.processMultiple(jsonfiles, logfilename, njobs, warmup,
+                                               manifestfilename))
+
+    def columns(self) -> Dict[str, int]:
+        """The metrics of all the keys, in the order they appear."""
+        columns: Dict[str, int] = {}
+        for samples in self.values():
+            for name in samples.keys():
+                columns.setdefault(name, len(columns))
+        return columns
+
+    def toTable(self, stat: str = "mean") -> pd.DataFrame:
+        """A row per key with the stat ("mean", "std", "min", "max" or
+        "median") of every metric, built in place from the MyDict arrays."""
+        columns: Dict[str, int] = self.columns()
+        table: np.ndarray = np.full((len(self), len(columns)), np.nan)
+        for row, samples in enumerate(self.values()):
+            if len(samples):
+                table[row, [columns[name] for name in samples.keys()]] = getattr(samples, stat)()
+
+        return pd.DataFrame(table, index=list(self.keys()), columns=list(columns))
+
+    def samples(self) -> np.ndarray:
+        """All the samples in a (keys, repeats, metrics) array in the order
+        of keys() and columns(), NaN after the samples of every metric."""
+        columns: Dict[str, int] = self.columns()
+        nrows: int = max((len(samples.samples()) for samples in self.values()), default=0)
+
+        cube: np.ndarray = np.full((len(self), nrows, len(columns)), np.nan)
+        for key, samples in zip(cube, self.values()):
+            data: np.ndarray = samples.samples()
+            key[:len(data), [columns[name] for name in samples.keys()]] = data
+        return cube
+
+    def summary(self, trim: float = 0.1, nboot: int = 1000) -> pd.DataFrame:
+        """The summarize statistics, a row per (key, metric) and a column per stat."""
+        stats: Dict[str, np.ndarray] = summarize(self.samples(), trim, nboot=nboot)
+        index = pd.MultiIndex.from_product([list(self.keys()), list(self.columns())],
+                                           names=["key", "metric"])
+        return pd.DataFrame({name: value.ravel() for name, value in stats.items()}, index=index)
 
 
 if __name__ == "__main__":
-    prefix: str = os.path.commonprefix(sys.argv[1:])[:-1]
+    parser = argparse.ArgumentParser(description="Collect the times of ProtoGrid result files.")
+    parser.add_argument("files", nargs="+", help="*_result_N.json files")
+    parser.add_argument("--spec", default=None,
+                        help="json file with the metrics to extract, by default metric_spec")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of processes reading the files (default: number of cores)")
+    parser.add_argument("--stream", action="store_true",
+                        help="read only the status and time_record of the result files, "
+                        "skipping the rest without loading it: bounded memory, but slower "
+                        "than the full load on documents with many small values")
+    parser.add_argument("--manifest", default=None,
+                        help="grid_runner manifest with the user times, by default the "
+                        "manifest.jsonl next to the files; submit.log is used when there is none")
+    parser.add_argument("--warmup", type=int, default=0,
+                        help="drop the first WARMUP repeats (_result_<i> with i < WARMUP)")
+    parser.add_argument("--stats", action="store_true",
+                        help="also write the robust statistics of every metric to _stats.csv")
+    parser.add_argument("--trim", type=float, default=0.1,
+                        help="fraction cut at each end for the trimmed mean (default: 0.1)")
+    parser.add_argument("--bootstrap", type=int, default=1000,
+                        help="resamples for the 95%% confidence interval of the mean")
+    parser.add_argument("--timing", action="store_true",
+                        help="print the extraction time per metric path")
+    args = parser.parse_args()
+
+    if args.spec:
+        extractor = MetricExtractor(loadSpec(args.spec))
+
+    if args.stream:
+        stream_keys = ("status", "time_record")
+
+    prefix: str = os.path.commonprefix(args.files)[:-1]
     logfilename: str = os.path.join(prefix, "submit.log")
+    manifestfilename: str = args.manifest or os.path.join(prefix, "manifest.jsonl")
 
-    data: MyTable = MyTable(sys.argv[1:], logfilename)
+    data: MyTable = MyTable(args.files, logfilename, args.jobs, args.warmup, manifestfilename)
 
     table: pd.DataFrame = data.toTable()
     print(tabulate(table, headers='keys', tablefmt='psql'))
     table.to_csv(prefix + "_times.csv")
+
+    if args.stats:
+        summary: pd.DataFrame = data.summary(args.trim, args.bootstrap)
+        print(tabulate(summary, headers='keys', tablefmt='psql'))
+        summary.to_csv(prefix + "_stats.csv")
+
+    if args.timing:
+        extractor.report()
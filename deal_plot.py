@@ -1,64 +1,189 @@
-
 import os, sys
+import glob
+import pickle
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, TextIO, Pattern, Callable, TypeAlias, NewType
 
 from tabulate import tabulate
 import pandas as pd
 import matplotlib.pyplot as plt
 
-def readPrint(name: str) -> pd.DataFrame:
-    table: pd.DataFrame = pd.read_csv(name, index_col=0)
-    print(name)
-    print(tabulate(table, headers='keys', tablefmt='psql'))
-
-    ax = table.plot(y=["Total Internal"], kind="barh", figsize=(10,6))
-    plt.tight_layout()
-    ax.get_figure().savefig(prefix + "_Internal.png")
-
-    return table
-
-if __name__ == "__main__":
-    data: Dict[str, pd.DataFrame] = {}
-
-    data["Autocall"] = readPrint("FlujosOut_nocal_times.csv")
-
-    data["Sampling No Threads"] = readPrint("SamplingOut_1_times.csv")
-    data["Sampling Threads"] = readPrint("SamplingOut_0_times.csv")
-
-    data["Flows No Threads"] = readPrint("FlujosOut_1_times.csv")
-    data["Flows Threads"] = readPrint("FlujosOut_0_times.csv")
-
-    # Construct the temporal sheets
-    compare_best = pd.DataFrame(index=data["Autocall"].index)
-
-    for key, value in data.items():
-        print(value.loc[:,["Total User"]])
-        compare_best[key] = value["Total User"]
-
-    compare_best.to_csv("compare_best_user_times.csv")
-
-    print(tabulate(compare_best, headers='keys', tablefmt='psql'))
-
-    # Grafico tiempos totales
-    ax = compare_best.loc[::-1,::-1].plot(kind="barh", figsize=(10,6), width=0.8, legend='reverse')
+def runName(filename: str) -> str:
+    """The run of a deal_parser output: SamplingOut_1_times.csv -> SamplingOut_1."""
+    name: str = os.path.basename(filename)
+    return name[:-len("_times.csv")] if name.endswith("_times.csv") else os.path.splitext(name)[0]
+
+def runNames(filenames: list[str]) -> list[str]:
+    """runName of every file, with its parent directory when the name is repeated.
+
+    Raises ValueError when the names are still repeated with the directory.
+    """
+    names: list[str] = [runName(filename) for filename in filenames]
+    repeated: set[str] = {name for name in names if names.count(name) > 1}
+    names = [os.path.join(os.path.basename(os.path.dirname(os.path.abspath(filename))), name)
+             if name in repeated else name for name, filename in zip(names, filenames)]
+
+    if len(set(names)) != len(names):
+        duplicated: list[str] = sorted({name for name in names if names.count(name) > 1})
+        raise ValueError(f"Runs with the same name: {', '.join(duplicated)}")
+    return names
+
+def readLong(filename: str) -> pd.DataFrame:
+    """Read a deal_parser _times.csv as (deal, metric, value) rows."""
+    table: pd.DataFrame = pd.read_csv(filename, index_col=0)
+    table.index.name = "deal"
+    return table.reset_index().melt(id_vars="deal", var_name="metric", value_name="value").dropna()
+
+class CsvCache:
+    """Pickle with the long tables of the csv files, {path: (mtime, size, table)}.
+
+    Only the files whose mtime or size changed since they were cached are
+    read again.
+    """
+
+    def __init__(self, filename: str | None):
+        self.filename: str | None = filename
+        self.entries: Dict[str, tuple] = {}
+        self.dirty: bool = False
+
+        if filename:
+            try:
+                with open(filename, "rb") as pkl:
+                    self.entries = pickle.load(pkl)
+            except (IOError, pickle.UnpicklingError, EOFError):
+                self.entries = {}
+
+    def get(self, path: str) -> pd.DataFrame | None:
+        entry: tuple | None = self.entries.get(path)
+        stat = os.stat(path)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        return None
+
+    def set(self, path: str, table: pd.DataFrame) -> None:
+        stat = os.stat(path)
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, table)
+        self.dirty = True
+
+    def save(self) -> None:
+        if self.filename and self.dirty:
+            with open(self.filename, "wb") as pkl:
+                pickle.dump(self.entries, pkl)
+
+def loadRuns(filenames: list[str], cache: CsvCache, njobs: int | None = None) -> pd.DataFrame:
+    """Load the csv files in threads into a single (run, deal, metric, value) table."""
+    stale: list[str] = [filename for filename in filenames if cache.get(filename) is None]
+    with ThreadPoolExecutor(max_workers=njobs) as executor:
+        for filename, table in zip(stale, executor.map(readLong, stale)):
+            cache.set(filename, table)
+    cache.save()
+
+    print(f"Read {len(stale)} of {len(filenames)} files, the rest are cached")
+    names: list[str] = runNames(filenames)
+    tables: Dict[str, pd.DataFrame] = {name: cache.get(filename) for name, filename in zip(names, filenames)}
+    return pd.concat(tables, names=["run", None]).reset_index(level=0).reset_index(drop=True)
+
+def compareView(runs: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """deal x run table with the metric, in the order of the runs."""
+    order: list[str] = list(runs["run"].unique())
+    view: pd.DataFrame = runs[runs["metric"] == metric].pivot(index="deal", columns="run", values="value")
+    return view.reindex(columns=order)
+
+def ratioView(compare: pd.DataFrame, baseline: str) -> pd.DataFrame:
+    """The compare table relative to the baseline run."""
+    return compare.div(compare[baseline], axis=0)
+
+def bestView(compare: pd.DataFrame) -> pd.DataFrame:
+    """The best (lowest) run of every deal, its value and the speedup over the worst."""
+    valid: pd.DataFrame = compare.dropna(how="all")
+    return pd.DataFrame({
+        "best": valid.idxmin(axis=1),
+        "value": valid.min(axis=1),
+        "speedup": valid.max(axis=1) / valid.min(axis=1),
+    })
+
+def contributionView(runs: pd.DataFrame, parts: list[str], total: str) -> pd.DataFrame:
+    """(run, deal) x part table with the fraction of total spent in every part."""
+    selected: pd.DataFrame = runs[runs["metric"].isin(parts + [total])]
+    view: pd.DataFrame = selected.pivot_table(index=["run", "deal"], columns="metric",
+                                               values="value", sort=False)
+    view = view.reindex(columns=parts + [total])
+    return view[parts].div(view[total], axis=0)
+
+def plotCompare(compare: pd.DataFrame, filename: str) -> None:
+    ax = compare.loc[::-1,::-1].plot(kind="barh", figsize=(10,6), width=0.8, legend='reverse')
     plt.tight_layout()
     plt.axvline(x=60, linestyle=":", color="gray", )
-    ax.get_figure().savefig("Compare_User.png")
-    print(f"Saving Compare_User.png")
-
-    # Graficos contribuciones (Flows n threads)
-    for key, value in list(data.items())[1:]:
-        ax = data[key].loc[::-1,["Sampling", "Regressors", "HestonTotal"]].plot.barh(stacked=True, figsize=(10,6), width=0.8)
+    ax.get_figure().savefig(filename)
+    plt.close(ax.get_figure())
+    print(f"Saving {filename}")
+
+def plotContributions(runs: pd.DataFrame, parts: list[str]) -> None:
+    """A stacked bar plot of the parts for every run."""
+    view: pd.DataFrame = runs[runs["metric"].isin(parts)].pivot_table(
+        index=["run", "deal"], columns="metric", values="value", sort=False)
+    for run, table in view.groupby(level="run", sort=False):
+        ax = table.droplevel("run").reindex(columns=parts).loc[::-1].plot.barh(
+            stacked=True, figsize=(10,6), width=0.8)
         plt.tight_layout()
         plt.axvline(x=60, linestyle=":", color="gray", )
-        filename: str = "Constributions_" + key.replace(" ","_") + ".png"
+        filename: str = "Contributions_" + run.replace(" ","_").replace(os.sep,"_") + ".png"
         ax.get_figure().savefig(filename)
+        plt.close(ax.get_figure())
         print(f"Saving {filename}")
 
-
-    # Comparaciones
-    ## Autocall
-    compare_nocall = compare_best.div(compare_best["Autocall"], axis=0)
-    print(tabulate(compare_nocall, headers='keys', tablefmt='psql', floatfmt=".2f"))
-    compare_best.to_csv("compare_nocall.csv")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the deal_parser times of several runs.")
+    parser.add_argument("files", nargs="*", default=["*_times.csv"],
+                        help="_times.csv files or glob patterns (default: *_times.csv)")
+    parser.add_argument("--metric", default="Total User", help="metric to compare (default: Total User)")
+    parser.add_argument("--baseline", default=None,
+                        help="run the ratios are relative to (default: the first one)")
+    parser.add_argument("--parts", nargs="+", default=["Sampling", "Regressors", "HestonTotal"],
+                        help="metrics of the contribution views")
+    parser.add_argument("--total", default="Total Internal",
+                        help="metric the contributions are relative to")
+    parser.add_argument("--cache", default=None,
+                        help="pickle file to keep the tables, only changed files are read again")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="threads reading the files")
+    parser.add_argument("--plot", action="store_true", help="save the comparison plots")
+    args = parser.parse_args()
+
+    filenames: list[str] = []
+    for pattern in args.files:
+        matches: list[str] = sorted(glob.glob(pattern))
+        if not matches:
+            print(f"No file matches '{pattern}'", file = sys.stderr)
+        filenames += [filename for filename in matches if filename not in filenames]
+
+    if not filenames:
+        sys.exit("No input files")
+
+    try:
+        runs: pd.DataFrame = loadRuns(filenames, CsvCache(args.cache), args.jobs)
+    except ValueError as error:
+        sys.exit(str(error))
+    runs.to_csv("compare_long.csv", index=False)
+
+    compare: pd.DataFrame = compareView(runs, args.metric)
+    print(tabulate(compare, headers='keys', tablefmt='psql'))
+    compare.to_csv("compare_" + args.metric.replace(" ","_") + ".csv")
+
+    baseline: str = args.baseline or compare.columns[0]
+    ratio: pd.DataFrame = ratioView(compare, baseline)
+    print(tabulate(ratio, headers='keys', tablefmt='psql', floatfmt=".2f"))
+    ratio.to_csv("compare_nocall.csv")
     print(f"Saving compare_nocall.csv")
+
+    best: pd.DataFrame = bestView(compare)
+    print(tabulate(best, headers='keys', tablefmt='psql'))
+    best.to_csv("compare_best.csv")
+
+    contributions: pd.DataFrame = contributionView(runs, args.parts, args.total)
+    contributions.to_csv("compare_contributions.csv")
+    print(f"Saving compare_contributions.csv")
+
+    if args.plot:
+        plotCompare(compare, "Compare_User.png")
+        plotContributions(runs, args.parts)
@@ -1,13 +1,30 @@
 #/bin/env python3
 
 import os, sys
+import time
 from typing import *
+from concurrent.futures import ProcessPoolExecutor
 import json
 import pandas as pd
 import matplotlib.pyplot as plt 
 from tabulate import tabulate
 import argparse
 
+try:
+    import orjson
+
+    def loadJson(data: bytes) -> Dict:
+        return orjson.loads(data)
+
+    def dumpCompact(data: Dict) -> bytes:
+        return orjson.dumps(data)
+except ImportError:
+    def loadJson(data: bytes) -> Dict:
+        return json.loads(data)
+
+    def dumpCompact(data: Dict) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode()
+
 trigger_info : Dict = {
     "coupon": {
         "value": 0
@@ -31,7 +48,10 @@ asian_tail : Dict = {
 }
 
 def process_file(filein: TextIO) -> Dict[str, float]:
-    data: Dict = json.load(filein)
+    return transform(json.load(filein))
+
+def transform(data: Dict) -> Dict:
+    """Convert a callable request into an autocall (DOUBLETRIGGER) one."""
     output: Dict = dict(data)
 
     payload = output["payload"]
@@ -78,25 +98,86 @@ def process_file(filein: TextIO) -> Dict[str, float]:
 
     return output
 
+def isUpToDate(filename: str, outfilename: str) -> bool:
+    """If the output exists and is newer than the input."""
+    return os.path.isfile(outfilename) \
+        and os.path.getmtime(outfilename) > os.path.getmtime(filename)
+
+def convertFile(filename: str, outfilename: str, pretty: bool) -> tuple[int, str | None]:
+    """Convert a request file: (bytes read, error)."""
+    try:
+        with open(filename, "rb") as fin:
+            data: bytes = fin.read()
+        transformed_json: Dict = transform(loadJson(data))
+
+        if pretty:
+            with open(outfilename, "w") as fout:
+                json.dump(transformed_json, fout, indent=4)
+        else:
+            with open(outfilename, "wb") as fout:
+                fout.write(dumpCompact(transformed_json))
+    except IOError:
+        return 0, f"Couldn't convert input:{filename}"
+    except (KeyError, ValueError, TypeError, AttributeError, IndexError) as error:
+        return 0, f"Input {filename} is not a callable request: {error!r}"
+
+    return len(data), None
+
 if __name__ == "__main__":
-    inprefix : str = os.path.dirname(os.path.commonprefix(sys.argv[1:]))
+    parser = argparse.ArgumentParser(description="Convert callable requests into autocall ones.")
+    parser.add_argument("files", nargs="+", help="request json files")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of processes converting the files (default: number of cores)")
+    parser.add_argument("--pretty", action="store_true",
+                        help="write indented json instead of compact json")
+    parser.add_argument("--force", action="store_true",
+                        help="convert also the files whose output is newer than the input")
+    args = parser.parse_args()
+
+    inprefix : str = os.path.dirname(os.path.commonprefix(args.files))
     outprefix : str = inprefix+"_nocal"
-    os.mkdir(outprefix)
+    os.makedirs(outprefix, exist_ok=True)
 
-    for filename in sys.argv[1:]:
+    pending : list[tuple[str, str]] = []
+    skipped : int = 0
+    for filename in args.files:
         if os.path.isfile(filename):
-            print(f"Processing {filename}")
-            transformed_json : Dict
-            try:
-                with open(filename) as fin:
-                    transformed_json = process_file(fin)
-
-                outfilename : str = filename.replace(inprefix, outprefix)
-                with open(outfilename, "w") as fout:
-                    print(f"Write output to {outfilename}")
-                    json.dump(transformed_json, fout, indent=4)
-
-            except IOError:
-                print(f"Couldn't open input:{fname_in}", file = sys.stderr)
+            outfilename : str = filename.replace(inprefix, outprefix)
+            if not args.force and isUpToDate(filename, outfilename):
+                skipped += 1
+                continue
+            pending.append((filename, outfilename))
         else:
             print(f"Path: '{filename}' is not a file", file = sys.stderr)
+
+    start : float = time.perf_counter()
+    inputs : list[str] = [filename for filename, _ in pending]
+    outputs : list[str] = [outfilename for _, outfilename in pending]
+    pretty : list[bool] = [args.pretty] * len(pending)
+
+    if args.jobs == 1:
+        results = map(convertFile, inputs, outputs, pretty)
+    else:
+        workers : int = args.jobs or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers)
+        chunksize : int = max(1, len(pending) // (4 * workers))
+        results = executor.map(convertFile, inputs, outputs, pretty, chunksize=chunksize)
+
+    converted : int = 0
+    total : int = 0
+    for (filename, outfilename), (size, error) in zip(pending, results):
+        if error:
+            print(error, file = sys.stderr)
+            continue
+        print(f"Write output to {outfilename}")
+        converted += 1
+        total += size
+
+    if args.jobs != 1:
+        executor.shutdown()
+
+    elapsed : float = max(time.perf_counter() - start, 1E-9)
+    megabytes : float = total / 2**20
+    print(f"Converted {converted} files ({megabytes:.1f} MB) in {elapsed:.3f}s: "
+          f"{converted / elapsed:.1f} files/s, {megabytes / elapsed:.1f} MB/s; "
+          f"{skipped} up to date, {len(pending) - converted} failed")
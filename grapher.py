@@ -14,7 +14,19 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys, os
+import io
 import json
+import time
+import queue
+import threading
+import multiprocessing
+import multiprocessing.util
+import hashlib
+import inspect
+import ast
+import functools
+import types
+import argparse
 import pandas as pd
 import numpy as np
 import pprint
@@ -22,9 +34,14 @@ import pickle
 from typing import *
 
 from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
 
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+import matplotlib.image as mpimg
+from matplotlib.container import ErrorbarContainer
+
+import scaling
 
 plt.rcParams['font.family'] = 'sans-serif'
 plt.rcParams['font.style'] = 'normal'
@@ -34,75 +51,695 @@ pd.set_option('display.max_rows', None)
 
 colors_bs = list(mcolors.TABLEAU_COLORS.values()) + list(mcolors.BASE_COLORS.values())
 
-get_complexity : Dict[str, Callable[[int], float]] = {
-    "cholesky" : lambda x: (x**3)/3.0,
-    "matmul" : lambda x: x**3,
-    "matvec" : lambda x: x**2,
-    "jacobi" : lambda x: x**2
-}
+class Kernel(NamedTuple):
+    """Cost of one iteration of a benchmark.
+
+    flops and bytes are called with the numpy arrays of Rows, Tasksize and
+    Iterations of a table (one value per row) and return an array, so a
+    table with several sizes is computed at once.
+    """
+    flops : Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+    bytes : Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+
+
+kernels : Dict[str, Kernel] = {}
+
+def register_kernel(name : str,
+                    flops : Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray],
+                    bytes : Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]) -> None:
+    """Add a kernel, name is the prefix of its keys ("cholesky_memory_ompss2")."""
+    kernels[name] = Kernel(flops, bytes)
+
+
+def get_kernel(key : str) -> Kernel:
+    """The kernel of a benchmark key or prefix."""
+    prefix : str = key.split("_")[0]
+    if prefix not in kernels:
+        raise KeyError("No kernel registered for: " + prefix)
+    return kernels[prefix]
+
+
+# Bytes are the doubles of the matrices and vectors moved once per iteration.
+register_kernel("cholesky",
+                lambda n, ts, it: (n**3)/3.0,
+                lambda n, ts, it: 8.0 * n**2)
+register_kernel("matmul",
+                lambda n, ts, it: n**3,
+                lambda n, ts, it: 8.0 * 3 * n**2)
+register_kernel("matvec",
+                lambda n, ts, it: n**2,
+                lambda n, ts, it: 8.0 * (n**2 + 2 * n))
+register_kernel("jacobi",
+                lambda n, ts, it: n**2,
+                lambda n, ts, it: 8.0 * (n**2 + 3 * n))
+
+
+# How save_all_files keeps the figure next to the png: "pickle", "bundle" or "none"
+figure_store : str = "pickle"
+
+# scaling models overlaid on the scalability plots, and the node counts to
+# extrapolate them to
+scaling_fits : list[str] = []
+scaling_nodes : list[int] = []
+
+
+def save_bundle(filename: str, fig) -> None:
+    """Save the errorbar series of fig and its axes metadata in a npz file.
+
+    The arrays are named <axes>_<line>_{x,y,err} and the metadata is a json
+    string in "meta". load_bundle rebuilds the figure.
+    """
+    arrays : Dict[str, np.ndarray] = {}
+    meta : Dict = {"suptitle" : fig.get_suptitle(),
+                   "axes" : []}
+
+    for i, ax in enumerate(fig.axes):
+        spec = ax.get_subplotspec()
+        axmeta : Dict = {
+            "nrows" : spec.get_gridspec().nrows,
+            "ncols" : spec.get_gridspec().ncols,
+            "row" : spec.rowspan.start,
+            "col" : spec.colspan.start,
+            "title" : ax.get_title(),
+            "xlabel" : ax.get_xlabel(),
+            "ylabel" : ax.get_ylabel(),
+            "xscale" : ax.get_xscale(),
+            "yscale" : ax.get_yscale(),
+            "xticks" : [float(x) for x in ax.get_xticks()],
+            "xlim" : [float(x) for x in ax.get_xlim()],
+            "ylim" : [float(y) for y in ax.get_ylim()],
+            "legend" : ax.get_legend() is not None,
+            "lines" : []
+        }
+
+        for j, container in enumerate(ax.containers):
+            if not isinstance(container, ErrorbarContainer):
+                continue
+            data_line, _, barlinecols = container.lines
+            prefix : str = "{}_{}_".format(i, j)
+
+            arrays[prefix + "x"] = np.asarray(data_line.get_xdata(), dtype=float)
+            arrays[prefix + "y"] = np.asarray(data_line.get_ydata(), dtype=float)
+            if barlinecols:
+                # Symmetric errors: segments go from y - err to y + err
+                segments = barlinecols[0].get_segments()
+                arrays[prefix + "err"] = np.array([(seg[1][1] - seg[0][1]) / 2 for seg in segments])
+
+            axmeta["lines"].append({"name" : prefix,
+                                    "label" : container.get_label(),
+                                    "color" : mcolors.to_hex(data_line.get_color()),
+                                    "linewidth" : data_line.get_linewidth(),
+                                    "markersize" : data_line.get_markersize()})
+
+        meta["axes"].append(axmeta)
+
+    np.savez_compressed(filename + ".npz", meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_bundle(filename: str):
+    """Rebuild a figure saved with save_bundle."""
+
+    with np.load(filename) as bundle:
+        meta : Dict = json.loads(str(bundle["meta"]))
+        arrays : Dict[str, np.ndarray] = {name : bundle[name] for name in bundle.files}
+
+    fig = plt.figure()
+    fig.suptitle(meta["suptitle"])
+
+    for axmeta in meta["axes"]:
+        ax = fig.add_subplot(axmeta["nrows"], axmeta["ncols"],
+                             axmeta["row"] * axmeta["ncols"] + axmeta["col"] + 1)
+        ax.set_title(axmeta["title"])
+        ax.set_xlabel(axmeta["xlabel"])
+        ax.set_ylabel(axmeta["ylabel"])
+        ax.set_xscale(axmeta["xscale"])
+        ax.set_yscale(axmeta["yscale"])
+        ax.grid(color='b', ls = '-.', lw = 0.25)
+
+        for line in axmeta["lines"]:
+            name : str = line["name"]
+            ax.errorbar(arrays[name + "x"], arrays[name + "y"], arrays.get(name + "err"),
+                        fmt='o-', linewidth=line["linewidth"], color=line["color"],
+                        markersize=line["markersize"], label=line["label"])
+
+        ax.set_xticks(axmeta["xticks"])
+        ax.set_xlim(axmeta["xlim"])
+        ax.set_ylim(axmeta["ylim"])
+        if axmeta["legend"]:
+            ax.legend(fontsize='x-small')
+
+    return fig
+
+
+class _RasterCapture(io.BytesIO):
+    """File object for savefig(format='rgba') that keeps the rgba pixels.
+
+    savefig writes the whole buffer at once, while the canvas still has the
+    tight bbox size, so that is the shape of the image.
+    """
+
+    def __init__(self, fig):
+        super().__init__()
+        self.fig = fig
+        self.rgba : np.ndarray | None = None
+
+    def write(self, data) -> int:
+        renderer = self.fig.canvas.get_renderer()
+        self.rgba = np.frombuffer(bytes(data), dtype=np.uint8).reshape(
+            int(renderer.height), int(renderer.width), 4)
+        return len(data)
+
+
+class ImageWriter:
+    """Background thread encoding and writing the png files.
+
+    The main thread only rasterizes the figure and puts the pixels in a
+    bounded queue, PNG compression and disk writes overlap with the next
+    figure. Failures are collected and reported by flush.
+    """
+
+    def __init__(self, maxsize : int):
+        self.queue : queue.Queue = queue.Queue(maxsize=maxsize)
+        self.errors : list[str] = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                filename, rgba, dpi = item
+                mpimg.imsave(filename, rgba, format='png', origin='upper', dpi=dpi)
+            except Exception as error:
+                self.errors.append("{}: {}".format(item[0], error))
+            finally:
+                self.queue.task_done()
+
+    def submit(self, filename : str, fig, dpi : int) -> None:
+        """Rasterize fig and queue it, blocks if the queue is full."""
+        capture = _RasterCapture(fig)
+        fig.savefig(capture, dpi=dpi, format='rgba', bbox_inches='tight')
+        self.queue.put((filename, capture.rgba, dpi))
+
+    def flush(self) -> None:
+        """Wait for all the queued images, raise if any failed."""
+        self.queue.join()
+        if self.errors:
+            errors : list[str] = self.errors
+            self.errors = []
+            raise IOError("Failed to write images:\n  " + "\n  ".join(errors))
+
+
+# When set, save_all_files writes the png files in the background.
+image_writer : ImageWriter | None = None
 
 
 def save_all_files(filename: str, fig):
     """Save the graphs to two files."""
 
-    # Save the plots with pickle to recover them:
-    #
-    # import matplotlib.pyplot as plt
-    # import pickle
-    # with open('filename.pkl', 'rb') as pkl:
-    #     ax = pickle.load(pkl)
-    # plt.show()
-    with open(filename + ".pkl",'wb') as pkl:
-        pickle.dump(fig, pkl)
+    if figure_store == "pickle":
+        # Save the plots with pickle to recover them:
+        #
+        # import matplotlib.pyplot as plt
+        # import pickle
+        # with open('filename.pkl', 'rb') as pkl:
+        #     ax = pickle.load(pkl)
+        # plt.show()
+        with open(filename + ".pkl",'wb') as pkl:
+            pickle.dump(fig, pkl)
+        register_output(filename + ".pkl")
+    elif figure_store == "bundle":
+        # Save only the series, to recover them:
+        #
+        # import grapher as gr
+        # fig = gr.load_bundle('filename.npz')
+        # plt.show()
+        save_bundle(filename, fig)
+        register_output(filename + ".npz")
 
     # Save the image as a png
-    fig.savefig(filename + ".png",
-                dpi=300,
-                format='png',
-                #bbox_extra_artists=[leg],
-                bbox_inches='tight')
+    if image_writer:
+        image_writer.submit(filename + ".png", fig, 300)
+    else:
+        fig.savefig(filename + ".png",
+                    dpi=300,
+                    format='png',
+                    #bbox_extra_artists=[leg],
+                    bbox_inches='tight')
+    register_output(filename + ".png")
 
     print("Generated:", filename)
 
 
-def import_json_list(input_list : list[str]) -> Dict[str, pd.DataFrame]:
-    '''Imports a group of json files containing experiment results'''
+def get_parser(description : str) -> argparse.ArgumentParser:
+    """Command line arguments shared by all the plot drivers."""
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("files", nargs="+", help="json files with experiment results")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of processes rendering figures (default: 1)")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="directory to cache the imported json files")
+    parser.add_argument("--store", choices=["pickle", "bundle", "none"], default="pickle",
+                        help="keep the figures as pickle, as npz series bundle or not at all")
+    parser.add_argument("--write-queue", type=int, default=0, metavar="N",
+                        help="encode and write the png files in a background thread "
+                        "with up to N pending images (default: 0, synchronous)")
+    parser.add_argument("--lazy", action="store_true",
+                        help="only regenerate the figures whose data or parameters changed")
+    parser.add_argument("--fit", type=_model_list, default=[], metavar="MODEL[,MODEL...]",
+                        help="fit these scaling models and overlay them on the scalability plots "
+                        "(" + ", ".join(scaling.models) + ")")
+    parser.add_argument("--predict", type=_nodes_list, default=[], metavar="NODES[,NODES...]",
+                        help="node counts to extrapolate the fitted models to")
+    return parser
+
+
+def _model_list(text : str) -> list[str]:
+    """Comma separated scaling models of --fit."""
+    names : list[str] = text.split(",")
+    for name in names:
+        if name not in scaling.models:
+            raise argparse.ArgumentTypeError(f"invalid model: '{name}' (choose from "
+                                             + ", ".join(scaling.models) + ")")
+    return names
+
+
+def _nodes_list(text : str) -> list[int]:
+    """Comma separated node counts of --predict."""
+    try:
+        return [int(nodes) for nodes in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid node counts: '{text}'")
+
+
+def _init_worker(store : str, write_queue : int, fits : list[str], nodes : list[int],
+                 write_errors : multiprocessing.Queue):
+    """Workers never show figures, so use the non-interactive backend."""
+    global figure_store, scaling_fits, scaling_nodes
+    figure_store = store
+    scaling_fits = fits
+    scaling_nodes = nodes
+    set_write_queue(write_queue)
+    plt.switch_backend("Agg")
+    # Flush once when the worker exits, so the png writes overlap the next jobs
+    if image_writer:
+        multiprocessing.util.Finalize(None, _flush_worker, args=(write_errors,), exitpriority=10)
+
+
+def _flush_worker(write_errors : multiprocessing.Queue) -> None:
+    """Flush the images of a worker, send the failures to the parent."""
+    try:
+        flush_images()
+    except IOError as error:
+        write_errors.put(str(error))
+
+
+def set_write_queue(write_queue : int) -> None:
+    """Write the png files in the background with up to write_queue pending images."""
+    global image_writer
+    image_writer = ImageWriter(write_queue) if write_queue > 0 else None
+
+
+def flush_images() -> None:
+    """Wait until all the png files are written."""
+    if image_writer:
+        image_writer.flush()
+
+
+# Files written by the current job, reported back by _timed_job.
+_outputs : list[str] = []
+
+def register_output(filename : str) -> None:
+    """Record a file generated by the current job."""
+    _outputs.append(filename)
+
+
+def _timed_job(name : str, func : Callable, args : tuple) -> Tuple[str, float, list[str]]:
+    """Run a figure job and return its wall time and generated files.
+
+    The images of the job may still be in the write queue.
+    """
+    _outputs.clear()
+    start : float = time.perf_counter()
+    func(*args)
+    return name, time.perf_counter() - start, list(_outputs)
+
+
+def _hash_update(h, obj) -> None:
+    """Feed obj into the hash h, DataFrames by content."""
+    if isinstance(obj, Selector):
+        obj = obj.dt
+
+    if isinstance(obj, pd.DataFrame):
+        h.update(repr(list(obj.columns)).encode())
+        h.update(repr(list(obj.dtypes)).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            _hash_update(h, key)
+            _hash_update(h, value)
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for value in obj:
+            _hash_update(h, value)
+        h.update(b"]")
+    elif isinstance(obj, (np.ndarray, pd.api.extensions.ExtensionArray, pd.Series)):
+        _hash_update(h, list(obj))
+    else:
+        h.update(repr(obj).encode() + b";")
+
+
+def _is_local(obj) -> bool:
+    """If obj is defined in a module of this directory."""
+    module = obj if isinstance(obj, types.ModuleType) else inspect.getmodule(obj)
+    filename : str | None = getattr(module, "__file__", None)
+    return filename is not None \
+        and os.path.dirname(os.path.abspath(filename)) == os.path.dirname(os.path.abspath(__file__))
+
+
+def _code_names(code : types.CodeType) -> list[str]:
+    """Global and attribute names used by code and its nested functions."""
+    names : list[str] = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names += _code_names(const)
+    return names
+
+
+def _is_main(node : ast.stmt) -> bool:
+    """If node is the if __name__ == "__main__": block of a script."""
+    return isinstance(node, ast.If) and isinstance(node.test, ast.Compare) \
+        and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__"
+
+
+@functools.cache
+def _module_setup(module : types.ModuleType) -> str:
+    """Source of the module level statements of module out of its functions.
+
+    The constants, styles, rcParams and registrations as written, not their
+    current values, without the classes, functions and the main block.
+    """
+    source : str = inspect.getsource(module)
+    return "\n".join(ast.get_source_segment(source, node)
+                     for node in ast.parse(source).body
+                     if not isinstance(node, (ast.FunctionDef, ast.ClassDef))
+                     and not _is_main(node))
+
+
+@functools.cache
+def code_hash(func : Callable) -> str:
+    """Hash of the source of func and of what it uses from this directory.
+
+    The local functions, classes and modules it references are followed
+    recursively, plus the module level statements of their modules (see
+    _module_setup). The values of the globals are never hashed, so the
+    runtime options don't invalidate the figures; the ones that change the
+    output are explicit inputs of job_hash. Editing a comment elsewhere
+    doesn't invalidate the figures either.
+    """
+    h = hashlib.sha256()
+    seen : set[int] = set()
+    modules : set[int] = set()
+    pending : list = [func]
+
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
 
-    data : Dict[str, pd.DataFrame] = {}
+        h.update(inspect.getsource(obj).encode())
+        if isinstance(obj, types.ModuleType):
+            continue
+
+        module : types.ModuleType = inspect.getmodule(obj)
+        if id(module) not in modules:
+            modules.add(id(module))
+            h.update(_module_setup(module).encode())
+
+        functions : list = [obj] if inspect.isfunction(obj) else \
+            [value for value in vars(obj).values() if inspect.isfunction(value)]
+        for function in functions:
+            for name in _code_names(function.__code__):
+                value = function.__globals__.get(name)
+                if (inspect.isfunction(value) or inspect.isclass(value)
+                    or isinstance(value, types.ModuleType)) and _is_local(value):
+                    _hash_update(h, name)
+                    pending.append(value)
+
+    return h.hexdigest()
+
+
+def job_hash(func : Callable, args : tuple) -> str:
+    """Hash of everything a figure depends on.
+
+    The arguments (data slices, labels, sizes), the code of the function
+    (see code_hash) and the options that change the output: figure_store
+    and the scaling fits and nodes.
+    """
+    h = hashlib.sha256()
+    h.update(code_hash(func).encode())
+    _hash_update(h, figure_store)
+    _hash_update(h, scaling_fits)
+    _hash_update(h, scaling_nodes)
+    _hash_update(h, func.__module__ + "." + func.__qualname__)
+    _hash_update(h, args)
+    return h.hexdigest()
+
+
+manifest_name : str = ".figures.json"
+
+def run_jobs(jobs : list[Tuple[str, Callable, tuple]], njobs : int = 1,
+             lazy : bool = False) -> None:
+    """Execute independent figure jobs (name, func, args) in njobs processes.
+
+    Every job must be self contained (module level function and picklable
+    arguments) because with njobs > 1 it runs in a worker process.
+
+    With lazy the jobs whose job_hash matches the entry in manifest_name and
+    with all their output files are skipped. With the write queue every
+    worker flushes it only when it exits, at the end of the executor, and
+    the failed writes are raised here before the manifest is updated.
+    """
+
+    start : float = time.perf_counter()
+    times : list[Tuple[str, float, list[str]]] = []
+
+    manifest : Dict[str, Dict] = {}
+    hashes : Dict[str, str] = {}
+    if lazy:
+        try:
+            with open(manifest_name, 'r') as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+        pending : list = []
+        for job in jobs:
+            name, func, args = job
+            hashes[name] = job_hash(func, args)
+            entry : Dict = manifest.get(name, {})
+            if entry.get("hash") == hashes[name] \
+               and entry.get("files") and all(os.path.isfile(f) for f in entry["files"]):
+                print("Up to date:", name)
+            else:
+                pending.append(job)
+
+        print("Skipped {} up to date jobs".format(len(jobs) - len(pending)))
+        jobs = pending
+
+    if njobs > 1:
+        write_queue : int = image_writer.queue.maxsize if image_writer else 0
+        write_errors : multiprocessing.Queue = multiprocessing.Queue()
+        with ProcessPoolExecutor(max_workers=njobs, initializer=_init_worker,
+                                 initargs=(figure_store, write_queue,
+                                           scaling_fits, scaling_nodes,
+                                           write_errors)) as executor:
+            futures = [executor.submit(_timed_job, *job) for job in jobs]
+            for future in futures:
+                times.append(future.result())
+
+        # The workers have exited, so their flushes are done.
+        errors : list[str] = []
+        while not write_errors.empty():
+            errors.append(write_errors.get())
+        if errors:
+            raise IOError("\n".join(errors))
+    else:
+        for job in jobs:
+            times.append(_timed_job(*job))
+        flush_images()
+
+    elapsed : float = time.perf_counter() - start
+
+    if lazy:
+        for name, _, files in times:
+            manifest[name] = {"hash" : hashes[name], "files" : files}
+        with open(manifest_name, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    print("Job times ({} jobs, {} processes):".format(len(times), max(njobs, 1)))
+    for name, seconds, _ in sorted(times, key=lambda x: x[1], reverse=True):
+        print("  {:8.3f}s  {}".format(seconds, name))
+    print("  Total: {:.3f}s in {:.3f}s wall".format(sum(t for _, t, _ in times), elapsed))
+
+
+def read_results(f) -> Dict[str, list]:
+    """Read a results file as {key: [rows]}.
+
+    Accepts the json written by process_dim and the json lines written in
+    its streaming mode, where every line is a single {key: row}.
+    """
+    if not f.name.endswith(".jsonl"):
+        return json.load(f)
+
+    fdata : Dict[str, list] = {}
+    for line in f:
+        if line.strip():
+            for key, row in json.loads(line).items():
+                fdata.setdefault(key, []).append(row)
+    return fdata
+
+
+class JsonCache:
+    """On disk cache of the DataFrames imported from json files.
+
+    There is one pickle file per experiment key with a dict {source_path:
+    DataFrame}, so every source is restored with exactly the same columns and
+    dtypes. manifest.json maps each source path to its mtime, size and the
+    keys it contributed to.
+    """
+
+    def __init__(self, cachedir : str):
+        self.cachedir : str = cachedir
+        self.manifest_name : str = os.path.join(cachedir, "manifest.json")
+        self.frames : Dict[str, Dict[str, pd.DataFrame]] = {}
+        self.dirty : set[str] = set()
+
+        os.makedirs(cachedir, exist_ok=True)
+        try:
+            with open(self.manifest_name, 'r') as f:
+                self.manifest : Dict[str, Dict] = json.load(f)
+        except (IOError, ValueError):
+            self.manifest = {}
+
+    def _key_filename(self, key : str) -> str:
+        return os.path.join(self.cachedir, key + ".pkl")
+
+    def _key_frames(self, key : str) -> Dict[str, pd.DataFrame]:
+        """Load lazily the cache file for key."""
+        if key not in self.frames:
+            try:
+                with open(self._key_filename(key), 'rb') as pkl:
+                    self.frames[key] = pickle.load(pkl)
+            except (IOError, pickle.UnpicklingError, EOFError):
+                self.frames[key] = {}
+        return self.frames[key]
+
+    def get(self, path : str) -> Dict[str, pd.DataFrame] | None:
+        """Get the frames for path if the file didn't change since cached."""
+        entry : Dict | None = self.manifest.get(path)
+        if not entry:
+            return None
+
+        stat = os.stat(path)
+        if entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            return None
+
+        result : Dict[str, pd.DataFrame] = {}
+        for key in entry["keys"]:
+            frames = self._key_frames(key)
+            if path not in frames:
+                return None
+            result[key] = frames[path]
+
+        return result
+
+    def set(self, path : str, fdata : Dict[str, pd.DataFrame]) -> None:
+        """Update the entries for path."""
+        old : Dict = self.manifest.get(path, {})
+        for key in old.get("keys", []):
+            if self._key_frames(key).pop(path, None) is not None:
+                self.dirty.add(key)
+
+        for key, df in fdata.items():
+            self._key_frames(key)[path] = df
+            self.dirty.add(key)
+
+        stat = os.stat(path)
+        self.manifest[path] = {"mtime" : stat.st_mtime_ns,
+                               "size" : stat.st_size,
+                               "keys" : list(fdata.keys())}
+
+    def write(self) -> None:
+        """Write the modified key files and the manifest."""
+        for key in self.dirty:
+            with open(self._key_filename(key), 'wb') as pkl:
+                pickle.dump(self.frames[key], pkl, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with open(self.manifest_name, 'w') as f:
+            json.dump(self.manifest, f, indent=4)
+
+        self.dirty.clear()
+
+
+def import_json_list(input_list : list[str],
+                     cachedir : str | None = None) -> Dict[str, pd.DataFrame]:
+    '''Imports a group of json files containing experiment results
+
+    Files can be .json or .jsonl (from process_dim --stream). When cachedir
+    is set the files that didn't change since the previous import are
+    loaded from the cache and only the new or modified ones are parsed.
+    '''
+
+    parts : Dict[str, list[pd.DataFrame]] = {}
 
     if not input_list:
         raise ValueError("Imput list is empty.")
 
+    cache : JsonCache | None = JsonCache(cachedir) if cachedir else None
+
     for fname in input_list:
 
-        if fname.split(".")[-1] != "json":
+        if fname.split(".")[-1] not in ["json", "jsonl"]:
             print("Import ignores:", fname, \
                   "because it is not a json", file = sys.stderr)
             continue
 
         try:
-            print("Loading:", fname, end="... ")
+            path : str = os.path.abspath(fname)
+            fdata : Dict[str, pd.DataFrame] | None = cache.get(path) if cache else None
 
-            with open(fname, 'r') as f:
-                fdata = json.load(f)
-
-                # key is the experiment: cholesky_fare_ompss2_taskfor
-                for key in fdata:
+            if fdata is not None:
+                print("Cached:", fname)
+            else:
+                print("Loading:", fname, end="... ")
 
+                with open(fname, 'r') as f:
+                    # key is the experiment: cholesky_fare_ompss2_taskfor
                     # data to Pandas Dataframe
-                    df_in: pd.DataFrame = pd.DataFrame(fdata[key])
+                    fdata = {key : pd.DataFrame(value) for key, value in read_results(f).items()}
+
+                if cache:
+                    cache.set(path, fdata)
 
-                    if key in data:
-                        data[key] = pd.concat([data[key], df_in], ignore_index=True)
-                    else:
-                        data[key] = df_in
+                print("Done")
 
-            print("Done")
+            for key, df_in in fdata.items():
+                parts.setdefault(key, []).append(df_in)
 
         except IOError:
             print("File not accessible or json corrupt", file = sys.stderr)
 
-    return data
+    if cache:
+        cache.write()
+
+    # Single concat per experiment.
+    return {key : pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            for key, frames in parts.items()}
 
 
 def add_time(ax, dt_ts : pd.DataFrame, label: str, colorname : str):
@@ -128,8 +765,32 @@ def add_scalability(ax, dt_ts : pd.DataFrame, label: str, colorname : str):
         print("Ignoring:", label, "is empty", file = sys.stderr)
         return
 
+    if 'Scalability' in dt_ts.columns and not dt_ts['Scalability'].isna().any():
+        # Precomputed by get_best_table
+        ax.errorbar(dt_ts['worldsize'], dt_ts['Scalability'], dt_ts['Scalability_ERR'],
+                    fmt ='o-', linewidth=1, color=colorname,
+                    markersize=2, label=label)
+        if scaling_fits:
+            one : float = (dt_ts['Algorithm_time'] * dt_ts['Scalability']).values[0]
+            add_scaling_fits(ax, dt_ts, one, colorname)
+        return
+
+    if 'Scalability' in dt_ts.columns and not scaling_fits:
+        print("Single node problem for:", label, file = sys.stderr)
+        return
+
     row_one : pd.DataFrame = dt_ts.loc[dt_ts['worldsize'] == 1]
-    if len(row_one.axes[0]) != 1:
+    one : float = np.nan
+    errone : float = 0.0
+    if len(row_one.axes[0]) == 1:
+        one = row_one['Algorithm_time'].values[0]
+        errone = (row_one['Algorithm_time_stdev'] / (row_one['executions']**(1/2))).values[0]
+    elif scaling_fits and row_one.empty:
+        # Without the single node run the speedup is against the modeled one
+        one = scaling.fit(dt_ts, scaling_fits[0])['T1'].values[0]
+        print("Using the", scaling_fits[0], "single node time for:", label, file = sys.stderr)
+
+    if np.isnan(one):
         print("Single node problem for:", label, file = sys.stderr)
         print("Input data:")
         print(dt_ts)
@@ -138,9 +799,6 @@ def add_scalability(ax, dt_ts : pd.DataFrame, label: str, colorname : str):
     dt_sorted : pd.DataFrame = dt_ts.sort_values(by=['worldsize'])
     x : pd.Series = dt_sorted['worldsize']
 
-    one : float = row_one['Algorithm_time'].values[0]
-    errone : float = (row_one['Algorithm_time_stdev'] / (row_one['executions']**(1/2))).values[0]
-
     # Error
     y  : pd.Series = dt_sorted['Algorithm_time']
     erry : pd.Series = dt_sorted['Algorithm_time_stdev'].divide(dt_sorted['executions']**(1/2))
@@ -152,6 +810,28 @@ def add_scalability(ax, dt_ts : pd.DataFrame, label: str, colorname : str):
                 linewidth=1, color=colorname,
                 markersize=2, label=label)
 
+    if scaling_fits:
+        add_scaling_fits(ax, dt_ts, one, colorname)
+
+
+# Line style of every scaling model in the plots
+scaling_styles : Dict[str, str] = {"amdahl" : "--", "gustafson" : ":", "comm" : "-."}
+
+def add_scaling_fits(ax, dt_ts : pd.DataFrame, one : float, colorname : str):
+    """Overlay the speedup one / T(p) of the scaling_fits models, up to scaling_nodes."""
+    nodes : np.ndarray = dt_ts['worldsize'].to_numpy(dtype=float)
+    p : np.ndarray = np.geomspace(nodes.min(), max([nodes.max()] + scaling_nodes), 64)
+    labels : set[str] = {line.get_label() for line in ax.get_lines()}
+
+    for name in scaling_fits:
+        coefs : np.ndarray = scaling.fit(dt_ts, name)[scaling.models[name].params].to_numpy()
+        if np.isnan(coefs).any():
+            continue
+        ax.plot(p, one / scaling.predict(coefs, name, p)[0], scaling_styles[name],
+                linewidth=0.75, color=colorname,
+                label=name if name not in labels else "_nolegend_")
+        labels.add(name)
+
 
 def add_performance(ax, dt : pd.DataFrame,
                     label: str, colorname : str):
@@ -168,45 +848,129 @@ def add_performance(ax, dt : pd.DataFrame,
                 linewidth=1, color=colorname,
                 markersize=2, label=label)
 
-def filter_rtc(dt : pd.DataFrame, **kwargs) -> pd.DataFrame:
-    '''Filter df_key by the criteria in argv'''
-    query : str = ""
-    for key, value in kwargs.items():
-        if key in dt:
-            if query: query += " & "
-            query += "{} == {}".format(key, value)
 
-    return dt.query(query)
+class Selector:
+    """Indexed equality selection over the columns of an experiment.
 
+    The groupby indices for every combination of columns are computed the
+    first time they are used, every later select is a dict lookup. select
+    takes column=value pairs and ignores the columns dt doesn't have.
+    """
 
-def filter_min(dt : pd.DataFrame) -> pd.DataFrame:
-    '''Get the rows with minimum time/worldsize'''
-    assert (not "iterations" in dt) or (dt["Iterations"].nunique() == 1)
-    return dt.loc[dt.groupby('worldsize')['Algorithm_time'].idxmin()].sort_values(by=['worldsize']).copy()
+    def __init__(self, dt : pd.DataFrame):
+        self.dt : pd.DataFrame = dt
+        self.indices : Dict[tuple, Dict] = {}
 
+    def select(self, **kwargs) -> pd.DataFrame:
+        cols : tuple = tuple(key for key in kwargs if key in self.dt)
+        if not cols:
+            return self.dt
 
-def get_performance_table(dt : pd.DataFrame, complexity : float) -> pd.DataFrame:
-    assert not dt.empty
+        index : Dict | None = self.indices.get(cols)
+        if index is None:
+            # With a single column the groupby keys are scalars.
+            index = self.dt.groupby(list(cols) if len(cols) > 1 else cols[0],
+                                    sort=False).indices
+            self.indices[cols] = index
 
-    time_per_iter : pd.Series = dt['Algorithm_time'].copy()
+        values = tuple(kwargs[key] for key in cols)
+        rows = index.get(values if len(cols) > 1 else values[0])
+        if rows is None:
+            return self.dt.iloc[0:0]
+
+        return self.dt.iloc[rows]
+
+
+def as_selector(dt : pd.DataFrame | Selector) -> Selector:
+    """Get a Selector, reuse it when dt already is one."""
+    return dt if isinstance(dt, Selector) else Selector(dt)
+
+
+def add_performance_columns(dt : pd.DataFrame, kernel : Kernel) -> pd.DataFrame:
+    """Add the performance of every row of dt with the kernel formulas.
+
+    Time_per_it, Complexity (flops per iteration), GFLOPS, GFLOPS_ERR,
+    Bytes (per iteration) and Intensity (flops/byte). The rows may have
+    different sizes or iterations, a table without Iterations or Tasksize
+    is taken as 1 iteration and NaN tasksize.
+    """
+    ones : np.ndarray = np.ones(len(dt))
+    rows : np.ndarray = dt['Rows'].to_numpy(dtype=float)
+    ts : np.ndarray = dt['Tasksize'].to_numpy(dtype=float) if 'Tasksize' in dt.columns else ones * np.nan
+    its : np.ndarray = dt['Iterations'].to_numpy(dtype=float) if 'Iterations' in dt.columns else ones
 
+    time_per_iter : pd.Series = dt['Algorithm_time'].copy()
     if "Iterations" in dt.columns:
-        assert dt["Iterations"].nunique() == 1
         time_per_iter /= dt["Iterations"]
 
-    dt = dt.filter(['worldsize', 'Rows', 'Tasksize', 'executions', 'Iterations',
-                    'Algorithm_time', 'Algorithm_time_stdev', 'cpu_count'],
-                   axis=1)
+    flops : np.ndarray = kernel.flops(rows, ts, its) * ones
+    nbytes : np.ndarray = kernel.bytes(rows, ts, its) * ones
 
     dt['Time_per_it'] = time_per_iter
-    dt['Complexity'] = complexity
-    dt['GFLOPS'] = complexity / time_per_iter
+    dt['Complexity'] = flops
+    dt['GFLOPS'] = flops / time_per_iter
     dt['GFLOPS_ERR'] = dt['GFLOPS'] * dt['Algorithm_time_stdev'] / dt['Algorithm_time']
+    dt['Bytes'] = nbytes
+    dt['Intensity'] = flops / nbytes
 
     return dt
 
 
-def process_tasksize(data : Dict[str, pd.DataFrame],
+def get_performance_table(dt : pd.DataFrame, kernel : Kernel) -> pd.DataFrame:
+    assert not dt.empty
+
+    dt = dt.filter(['worldsize', 'Rows', 'Tasksize', 'executions', 'Iterations',
+                    'Algorithm_time', 'Algorithm_time_stdev', 'cpu_count'],
+                   axis=1)
+
+    return add_performance_columns(dt, kernel)
+
+
+perf_columns : list[str] = ['worldsize', 'Rows', 'Tasksize', 'executions', 'Iterations',
+                             'Algorithm_time', 'Algorithm_time_stdev', 'cpu_count',
+                             'Time_per_it', 'Complexity', 'GFLOPS', 'GFLOPS_ERR']
+
+
+def get_best_table(dt : pd.DataFrame,
+                   kernel : Kernel,
+                   by : list[str] = ['Rows', 'Tasksize', 'cpu_count']) -> pd.DataFrame:
+    """Best row per worldsize with its performance for every group in by.
+
+    This is the row with the minimum Algorithm_time per worldsize +
+    get_performance_table + the scalability of add_scalability for all the
+    groups at once, with the performance columns of
+    add_performance_columns for the kernel. The result is
+    sorted by the groups and worldsize, Scalability is NaN in the groups
+    without a single node row. perf_columns are the columns of
+    get_performance_table.
+    """
+    by = [col for col in by if col in dt.columns]
+
+    if dt.empty:
+        return dt.iloc[0:0].assign(Time_per_it=[], Complexity=[], GFLOPS=[], GFLOPS_ERR=[],
+                                   Bytes=[], Intensity=[], Scalability=[], Scalability_ERR=[])
+
+    best : pd.DataFrame = dt.loc[dt.groupby(by + ['worldsize'])['Algorithm_time'].idxmin()]
+    best = best.sort_values(by=by + ['worldsize'])
+
+    best = add_performance_columns(best, kernel)
+
+    # Scalability against the single node row of every group.
+    y : pd.Series = best['Algorithm_time']
+    erry : pd.Series = best['Algorithm_time_stdev'].divide(best['executions']**(1/2))
+
+    groups = [best[col] for col in by] if by else np.zeros(len(best))
+    is_one : pd.Series = best['worldsize'] == 1
+    one : pd.Series = y.where(is_one).groupby(groups).transform('first')
+    errone : pd.Series = erry.where(is_one).groupby(groups).transform('first')
+
+    best['Scalability'] = one / y
+    best['Scalability_ERR'] = best['Scalability'] * (erry/y + errone/one)
+
+    return best
+
+
+def process_tasksize(data : Dict[str, pd.DataFrame | Selector],
                      keyslist:list,
                      rows:int,
                      ts:int,
@@ -233,15 +997,14 @@ def process_tasksize(data : Dict[str, pd.DataFrame],
     color_index : int = 0
 
     for key in data:
-        dt = filter_rtc(data[key],
-                        Rows=rows,
-                        Tasksize=ts,
-                        cpu_count=cpu_count)
+        selector : Selector = as_selector(data[key])
+        dt = selector.select(Rows=rows,
+                             Tasksize=ts,
+                             cpu_count=cpu_count)
 
-        prefix : str = key.split("_")[0]
         label : str = " ".join(key.split("_")[1:]) # "cholesky_memory_ompss2" -> "memory ompss2"
 
-        complexity : float = get_complexity[prefix](rows)
+        kernel : Kernel = get_kernel(key)
 
         if key.endswith("mpi"):
             dt = dt.drop_duplicates(subset='worldsize')
@@ -252,20 +1015,23 @@ def process_tasksize(data : Dict[str, pd.DataFrame],
             add_time(axs[0], dt, label, color)
             add_scalability(axs[1], dt, label, color)
 
-            dt_perf : pd.DataFrame = get_performance_table(dt, complexity)
+            dt_perf : pd.DataFrame = get_performance_table(dt, kernel)
             add_performance(axs[2], dt_perf, label, color)
         else:
             for ns in range(2):
                 color = colors_bs[color_index]
                 color_index = color_index + 1
 
-                dt_ns = filter_rtc(dt, namespace_enabled=ns)
+                dt_ns = selector.select(Rows=rows,
+                                        Tasksize=ts,
+                                        cpu_count=cpu_count,
+                                        namespace_enabled=ns)
                 labelns = label + [" nons", " ns"][ns]
 
                 add_time(axs[0], dt_ns, labelns, color)
                 add_scalability(axs[1], dt_ns, labelns, color)
 
-                dt_perf_ns : pd.DataFrame = get_performance_table(dt_ns, complexity)
+                dt_perf_ns : pd.DataFrame = get_performance_table(dt_ns, kernel)
                 add_performance(axs[2], dt_perf_ns, labelns, color)
 
     plt.legend(bbox_to_anchor=(1,1),
@@ -283,12 +1049,18 @@ def process_tasksize(data : Dict[str, pd.DataFrame],
     plt.close()
 
 
-def process_experiment(dt : pd.DataFrame,
+def process_experiment(dt : pd.DataFrame | Selector,
                        label : str,
                        rows : int,
                        ts_list : list[int],
-                       cpu_list : list[int]):
-    """Create graphs comparing all the TS for same size and num_cpus"""
+                       cpu_list : list[int],
+                       nodes_list : list[int] | None = None):
+    """Create graphs comparing all the TS for same size and num_cpus
+
+    nodes_list are the xticks, by default all the worldsizes in dt. When dt
+    is only a slice of the experiment pass them explicitly to get the same
+    axes.
+    """
 
     print("= Plot:", label, rows)
     fig, axs = plt.subplots(nrows=3, ncols=(len(cpu_list)),
@@ -297,16 +1069,28 @@ def process_experiment(dt : pd.DataFrame,
 
     # Title
     fig.suptitle(label + " " + str(rows))
-    nodes_list : list[int] = dt['worldsize'].drop_duplicates().sort_values().array
+    selector : Selector = as_selector(dt)
+
+    if nodes_list is None:
+        nodes_list = selector.dt['worldsize'].drop_duplicates().sort_values().array
 
     axs[0,0].set_ylabel("Time")
     axs[1,0].set_ylabel("Scalability")
     axs[2,0].set_ylabel("Performance(GFLops)")
 
     prefix : Final[str] = label.split("_")[0]
-    complexity : Final[float] = get_complexity[prefix](rows)
 
-    dt_rows = filter_rtc(dt, Rows=rows, namespace_enabled=1)
+    # All the best values for this size, the loops only index into it.
+    perf : Selector = Selector(get_best_table(selector.select(Rows=rows, namespace_enabled=1),
+                                              get_kernel(prefix),
+                                              ['cpu_count', 'Tasksize']))
+
+    if scaling_fits:
+        fits : pd.DataFrame = scaling.report(perf.dt, scaling_fits, ['cpu_count', 'Tasksize'],
+                                             scaling_nodes)
+        fname : str = "Scaling_" + label + "_" + str(rows) + ".csv"
+        fits.to_csv(fname, index = False)
+        register_output(fname)
 
     for i in range(len(cpu_list)):
         cores : int = cpu_list[i]
@@ -321,21 +1105,16 @@ def process_experiment(dt : pd.DataFrame,
 
         axs[2,i].set_xlabel('Nodes')
 
-        dt_rows_cpu = filter_rtc(dt_rows, cpu_count=cores)
-
         color_index : int = 0
         for ts in ts_list:
             linelabel : str = str(ts)
             color = colors_bs[color_index]
             color_index = color_index + 1
 
-            dt_rows_cpu_ts = filter_rtc(dt_rows_cpu, Tasksize=ts)
-            dt_rows_cpu_ts = filter_min(dt_rows_cpu_ts)
-
-            add_time(axs[0,i], dt_rows_cpu_ts, linelabel, color)
-            add_scalability(axs[1,i], dt_rows_cpu_ts, linelabel, color)
+            st_perf = perf.select(cpu_count=cores, Tasksize=ts)
 
-            st_perf = get_performance_table(dt_rows_cpu_ts, complexity)
+            add_time(axs[0,i], st_perf, linelabel, color)
+            add_scalability(axs[1,i], st_perf, linelabel, color)
             add_performance(axs[2,i], st_perf, linelabel, color)
 
         axs[0,i].legend(loc='upper right',
@@ -359,7 +1138,7 @@ def process_experiment(dt : pd.DataFrame,
     plt.close()
 
 
-def process_final(data : Dict[str, pd.DataFrame],
+def process_final(data : Dict[str, pd.DataFrame | Selector],
                   bench_dict : Dict[str, str],
                   rows : int,
                   cores : int,
@@ -371,7 +1150,6 @@ def process_final(data : Dict[str, pd.DataFrame],
     prefix : Final[str] = tmp[0]
 
     print("Processing:", prefix, rows, cores)
-    complexity : Final[float] = get_complexity[prefix](rows)
 
     fig, ax = plt.subplots()
     ax.set_xlabel("Number of nodes")
@@ -380,13 +1158,11 @@ def process_final(data : Dict[str, pd.DataFrame],
     color_index : int = 0
     for bench_name, label in bench_dict.items():
         assert bench_name.startswith(prefix)
-        dt : pd.DataFrame = filter_rtc(data[bench_name],
-                                       Rows=rows,
-                                       cpu_count=cores,
-                                       namespace_enabled=1)
-        dt = filter_min(dt)
-
-        dt_perf : pd.DataFrame = get_performance_table(dt, complexity)
+        dt : pd.DataFrame = as_selector(data[bench_name]).select(Rows=rows,
+                                                                 cpu_count=cores,
+                                                                 namespace_enabled=1)
+        dt_perf : pd.DataFrame = get_best_table(dt, get_kernel(prefix), ['Rows', 'cpu_count'])
+        dt_perf = dt_perf.filter(perf_columns, axis=1)
 
         add_performance(ax, dt_perf, label, colors_bs[color_index])
         color_index = color_index + 1
@@ -396,8 +1172,10 @@ def process_final(data : Dict[str, pd.DataFrame],
             print(dt_perf)
             fname : str = bench_name + "_" + str(rows) + "_" + str(cores)
             dt_perf.to_csv(fname + ".csv", index = False)
+            register_output(fname + ".csv")
 
 
     filename : str = fileprefix + "_" + prefix + "_" + str(rows) + "_" + str(cores)
     plt.legend(loc='upper left', fontsize='medium',)
     save_all_files(filename, fig)
+    plt.close()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Run every request of a directory repeats times with the ProtoGrid launcher.
+#
+# ./grid_runner.py -e ProtoGridLauncher.exe -c soam_client_data.json -i inputs -o output1 -r 5 --max-parallel 4 --pin
+
+import os, sys
+import time
+import json
+import queue
+import argparse
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, TextIO, NamedTuple
+
+class Job(NamedTuple):
+    """One execution: the request, the response file and the repeat index."""
+    input: str
+    output: str
+    repeat: int
+
+TASKSET: str | None = shutil.which("taskset")
+
+def listJobs(inputdir: str, outputdir: str, repeats: int) -> list[Job]:
+    """All the input x repeat jobs, by input name and then repeat."""
+    jobs: list[Job] = []
+    for bname in sorted(os.listdir(inputdir)):
+        if not bname.endswith(".json"):
+            continue
+        for i in range(repeats):
+            output: str = os.path.join(outputdir, bname.replace(".json", f"_result_{i}.json"))
+            jobs.append(Job(os.path.join(inputdir, bname), output, i))
+    return jobs
+
+def cpuSets(slots: int, pin: bool) -> list[list[int] | None]:
+    """Split the cpus of this process in slots disjoint sets, or no pinning."""
+    if not pin:
+        return [None] * slots
+
+    if not hasattr(os, "sched_setaffinity"):
+        print("CPU pinning is not supported in this platform, jobs are not pinned", file = sys.stderr)
+        return [None] * slots
+
+    cpus: list[int] = sorted(os.sched_getaffinity(0))
+    per: int = len(cpus) // slots
+    if per == 0:
+        raise ValueError(f"Can't pin {slots} parallel jobs to {len(cpus)} cpus")
+    return [cpus[i * per:(i + 1) * per] for i in range(slots)]
+
+def doneOutputs(manifestfile: str) -> set[str]:
+    """The outputs whose last run in the manifest finished with returncode 0."""
+    returncodes: Dict[str, int | None] = {}
+    if os.path.isfile(manifestfile):
+        with open(manifestfile) as fin:
+            for line in fin:
+                if line.strip():
+                    record: Dict = json.loads(line)
+                    returncodes[record["output"]] = record.get("returncode")
+    return {output for output, returncode in returncodes.items() if returncode == 0}
+
+def runJob(job: Job, command: list[str], cpus: list[int] | None) -> tuple[Dict, str]:
+    """Run a job, get its manifest record and its output.
+
+    The jobs run in threads, where preexec_fn is not safe, so the pinning is
+    done by taskset, or by setting the affinity of the child right after it
+    starts when there is no taskset.
+    """
+    launch: list[str] = command
+    if cpus and TASKSET:
+        launch = [TASKSET, "-c", ",".join(map(str, cpus))] + command
+
+    start: float = time.time()
+    begin: float = time.perf_counter()
+    with subprocess.Popen(launch, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          errors="replace") as process:
+        if cpus and not TASKSET:
+            os.sched_setaffinity(process.pid, cpus)
+        output: str = process.communicate()[0]
+    wall: float = time.perf_counter() - begin
+    end: float = time.time()
+
+    record: Dict = {
+        "input": job.input,
+        "output": job.output,
+        "repeat": job.repeat,
+        "command": " ".join(command),
+        "cpus": cpus,
+        "start": start,
+        "end": end,
+        "wall": wall,
+        "returncode": process.returncode,
+    }
+    return record, output
+
+def runGrid(jobs: list[Job], args: argparse.Namespace, cpusets: list[list[int] | None],
+            manifest: TextIO, log: TextIO) -> int:
+    """Run the jobs with one per cpu set at the same time, get the number of failures.
+
+    Every job takes a free cpu set while it runs, so the pinned jobs never
+    share cpus. The records are appended to the manifest as the jobs
+    finish, and the output of every job is written in a single block after
+    its "# Command:" line, so the log is not interleaved. A job that raises
+    doesn't lose the records of the others, the first error is raised once
+    all the jobs finished.
+    """
+    slots: queue.Queue = queue.Queue()
+    for cpus in cpusets:
+        slots.put(cpus)
+
+    def run(job: Job) -> tuple[Dict, str]:
+        cpus: list[int] | None = slots.get()
+        try:
+            return runJob(job, [args.executable, "-c", args.connection,
+                                "-i", job.input, "-o", job.output], cpus)
+        finally:
+            slots.put(cpus)
+
+    failed: int = 0
+    errors: list[Exception] = []
+    with ThreadPoolExecutor(max_workers=len(cpusets)) as executor:
+        futures = [executor.submit(run, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                record, output = future.result()
+            except Exception as error:
+                # Keep the records of the other jobs, raise when all finished
+                print(f"[{done}/{len(jobs)}] Error: {error}", file=sys.stderr)
+                errors.append(error)
+                continue
+
+            if output and not output.endswith("\n"):
+                output += "\n"
+            log.write(f"# Command: {record['command']} 2>&1\n{output}")
+            log.flush()
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+
+            if record["returncode"] != 0:
+                failed += 1
+            print(f"[{done}/{len(jobs)}] {record['output']} {record['wall']:.3f}s"
+                  f" (exit {record['returncode']})")
+
+    if errors:
+        raise errors[0]
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ProtoGrid requests of a directory.")
+    parser.add_argument("-e", "--executable", required=True, help="ProtoGridLauncher file")
+    parser.add_argument("-c", "--connection", required=True, help="Connection file")
+    parser.add_argument("-i", "--inputdir", required=True, help="Requests dir")
+    parser.add_argument("-o", "--outputdir", required=True, help="Responses dir")
+    parser.add_argument("-r", "--repeats", type=int, default=1, help="Repeat executions")
+    parser.add_argument("-p", "--max-parallel", type=int, default=1,
+                        help="number of jobs running at the same time (default: 1)")
+    parser.add_argument("--pin", action="store_true",
+                        help="pin every running job to its own share of the cpus")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the jobs that already succeeded in the manifest")
+    args = parser.parse_args()
+
+    if args.max_parallel < 1:
+        parser.error("--max-parallel must be at least 1")
+
+    try:
+        cpusets: list[list[int] | None] = cpuSets(args.max_parallel, args.pin)
+    except ValueError as error:
+        parser.error(str(error))
+
+    os.makedirs(args.outputdir, exist_ok=True)
+
+    manifestfile: str = os.path.join(args.outputdir, "manifest.jsonl")
+    jobs: list[Job] = listJobs(args.inputdir, args.outputdir, args.repeats)
+    if args.resume:
+        done: set[str] = doneOutputs(manifestfile)
+        pending: list[Job] = [job for job in jobs
+                              if job.output not in done or not os.path.isfile(job.output)]
+        print(f"Resuming: {len(jobs) - len(pending)} of {len(jobs)} jobs already done")
+        jobs = pending
+
+    start: float = time.perf_counter()
+    with open(manifestfile, "a") as manifest, \
+         open(os.path.join(args.outputdir, "submit.log"), "a") as log:
+        log.write("\n# " + " ".join(f"{key}: {value}" for key, value in vars(args).items()) + "\n")
+        failed: int = runGrid(jobs, args, cpusets, manifest, log)
+        log.write(f"# Total time is {time.perf_counter() - start:.3f}\n")
+
+    if failed:
+        sys.exit(f"{failed} of {len(jobs)} jobs failed")
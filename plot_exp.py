@@ -21,10 +21,11 @@ import pandas as pd
 from typing import *
 
 
-def process_all(data : Dict[str, pd.DataFrame]):
+def process_all(data : Dict[str, pd.DataFrame], njobs : int = 1, lazy : bool = False):
     """Create all the blocksize graphs"""
 
     keys_list : list[str] = list(data.keys());
+    jobs : list = []
 
     # All ts for same experiment.
     for key in keys_list:
@@ -34,11 +35,22 @@ def process_all(data : Dict[str, pd.DataFrame]):
         rows_list : list[int] = dt['Rows'].drop_duplicates().sort_values().array
         ts_list : list[int] = dt['Tasksize'].drop_duplicates().sort_values().array
         cpu_list : list[int] = dt['cpu_count'].drop_duplicates().sort_values().array
+        nodes_list : list[int] = dt['worldsize'].drop_duplicates().sort_values().array
 
+        selector : gr.Selector = gr.Selector(dt)
         for rows in rows_list:
-            gr.process_experiment(dt, key, rows, ts_list, cpu_list)
+            jobs.append(("Compare {} {}".format(key, rows),
+                         gr.process_experiment,
+                         (selector.select(Rows=rows), key, rows, ts_list, cpu_list, nodes_list)))
+
+    gr.run_jobs(jobs, njobs, lazy)
 
 
 if __name__ == "__main__":
-    data : Dict[str, pd.DataFrame] = gr.import_json_list(sys.argv[1:])
-    process_all(data)
+    args = gr.get_parser("Plot all the tasksizes of every experiment.").parse_args()
+    gr.figure_store = args.store
+    gr.scaling_fits = args.fit
+    gr.scaling_nodes = args.predict
+    gr.set_write_queue(args.write_queue)
+    data : Dict[str, pd.DataFrame] = gr.import_json_list(args.files, args.cache)
+    process_all(data, args.jobs, args.lazy)
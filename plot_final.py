@@ -43,23 +43,34 @@ transdic : Dict[str, Dict[str, str]] = {
     }
 }
 
-def process_prefix(data : Dict[str, pd.DataFrame],
+def process_prefix(selectors : Dict[str, gr.Selector],
                    bench_dict : Dict[str, str],
-                   prefix : str):
-    '''Process a prefix.'''
+                   prefix : str) -> list:
+    '''Get the jobs to process a prefix.'''
     first_key : str = list(bench_dict.keys())[0]
-    rows_list : list[int] = data[first_key]['Rows'].drop_duplicates().sort_values().array
-    cpu_list : list[int] = data[first_key]['cpu_count'].drop_duplicates().sort_values().array
+    rows_list : list[int] = selectors[first_key].dt['Rows'].drop_duplicates().sort_values().array
+    cpu_list : list[int] = selectors[first_key].dt['cpu_count'].drop_duplicates().sort_values().array
 
+    jobs : list = []
     for rows in rows_list:
         for cpu in cpu_list:
-            gr.process_final(data, bench_dict, rows, cpu, prefix)
+            data_slice : Dict[str, pd.DataFrame] = {
+                bench_name : selectors[bench_name].select(Rows=rows, cpu_count=cpu)
+                for bench_name in bench_dict
+            }
+            jobs.append(("{} {} {} {}".format(prefix, first_key, rows, cpu),
+                         gr.process_final,
+                         (data_slice, bench_dict, rows, cpu, prefix)))
 
+    return jobs
 
-def process_all(data : Dict[str, pd.DataFrame]):
+
+def process_all(data : Dict[str, pd.DataFrame], njobs : int = 1, lazy : bool = False):
     """Create all the graphs for every prefix."""
 
     keys_list : list[str] = list(data.keys())
+    selectors : Dict[str, gr.Selector] = {key : gr.Selector(data[key]) for key in keys_list}
+    jobs : list = []
     prefix_list : list[str]  = list(set([ key.split("_")[0] for key in keys_list]))
 
     # list of all the benchmarks starting with prefix.
@@ -69,13 +80,25 @@ def process_all(data : Dict[str, pd.DataFrame]):
         bench_dict : Dict[str, str] =  dict(zip(bench_list, bench_list))
 
         # Get graph with the best data.
-        process_prefix(data, bench_dict, "Final")
+        jobs += process_prefix(selectors, bench_dict, "Final")
 
         # Get graph filtered with transdic if prefix is defined.
         if (prefix in transdic):
-            process_prefix(data, transdic[prefix], "Official")
+            missing : list[str] = [key for key in transdic[prefix] if key not in selectors]
+            if missing:
+                print("Ignoring: Official", prefix, "graphs, missing keys:", ", ".join(missing),
+                      file = sys.stderr)
+                continue
+            jobs += process_prefix(selectors, transdic[prefix], "Official")
+
+    gr.run_jobs(jobs, njobs, lazy)
 
 
 if __name__ == "__main__":
-    data : Dict[str, pd.DataFrame] = gr.import_json_list(sys.argv[1:])
-    process_all(data)
+    args = gr.get_parser("Plot the final performance comparison graphs.").parse_args()
+    gr.figure_store = args.store
+    gr.scaling_fits = args.fit
+    gr.scaling_nodes = args.predict
+    gr.set_write_queue(args.write_queue)
+    data : Dict[str, pd.DataFrame] = gr.import_json_list(args.files, args.cache)
+    process_all(data, args.jobs, args.lazy)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022  Ergus
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import grapher as gr
+import sys
+import argparse
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+from typing import *
+
+
+def get_report_table(data : Dict[str, pd.DataFrame], peak : float | None = None) -> pd.DataFrame:
+    """Performance and efficiency of the best row of every configuration.
+
+    A row per key, Rows, Tasksize, cpu_count and worldsize with the
+    columns of gr.get_best_table. Efficiency_node is the scalability over
+    the single node run divided by the nodes, Efficiency_core compares
+    time x cores with the run with less cores of the same key, Rows and
+    Tasksize. Peak_fraction is GFLOPS over peak GFLOPS per core times the
+    cores, NaN without peak. Raises ValueError when no key has a kernel.
+    """
+    tables : list[pd.DataFrame] = []
+    for key, dt in data.items():
+        prefix : str = key.split("_")[0]
+        if prefix not in gr.kernels:
+            print("Ignoring:", key, "has no registered kernel", file = sys.stderr)
+            continue
+
+        if 'Tasksize' not in dt.columns:
+            print("Warning:", key, "has no Tasksize, its Efficiency_core is computed per Rows",
+                  file = sys.stderr)
+
+        dt = gr.as_selector(dt).select(namespace_enabled=1)
+        best : pd.DataFrame = gr.get_best_table(dt, gr.get_kernel(key))
+        best.insert(0, 'kernel', prefix)
+        best.insert(0, 'key', key)
+        tables.append(best)
+
+    if not tables:
+        raise ValueError("No experiment has a registered kernel: "
+                         + ", ".join(gr.kernels))
+
+    report : pd.DataFrame = pd.concat(tables, ignore_index=True)
+
+    cores : pd.Series = report['worldsize'] * report['cpu_count']
+    cost : pd.Series = report['Algorithm_time'] * cores
+    # Without Tasksize the key and Rows are the group
+    groups : list[pd.Series] = [report[col] for col in ['key', 'Rows', 'Tasksize']
+                                if col in report.columns]
+    reference : pd.Series = cost.where(cores == cores.groupby(groups, dropna=False).transform('min'))
+
+    report['cores'] = cores
+    report['Efficiency_node'] = report['Scalability'] / report['worldsize']
+    report['Efficiency_core'] = reference.groupby(groups, dropna=False).transform('min') / cost
+    report['Peak_fraction'] = report['GFLOPS'] / (peak * 1e9 * cores) if peak else np.nan
+
+    return report
+
+
+def get_ranking(report : pd.DataFrame, top : int = 1) -> pd.DataFrame:
+    """The top configurations of every kernel and size by GFLOPS."""
+    ranking : pd.DataFrame = report.sort_values(by=['kernel', 'Rows', 'GFLOPS'],
+                                                ascending=[True, True, False])
+    ranking.insert(2, 'Rank', ranking.groupby(['kernel', 'Rows']).cumcount() + 1)
+    ranking = ranking[ranking['Rank'] <= top]
+
+    return ranking.filter(['kernel', 'Rows', 'Rank', 'key', 'Tasksize', 'cpu_count', 'worldsize',
+                           'cores', 'Algorithm_time', 'GFLOPS', 'Intensity',
+                           'Efficiency_node', 'Efficiency_core', 'Peak_fraction'],
+                          axis=1).reset_index(drop=True)
+
+
+def plot_roofline(report : pd.DataFrame,
+                  peak : float | None,
+                  bandwidth : float | None,
+                  filename : str) -> None:
+    """All the experiments in a single roofline of one node.
+
+    The performance per node is plotted against the arithmetic intensity,
+    the roof uses peak GFLOPS per core for the largest cpu_count and
+    bandwidth GB/s per node.
+    """
+    fig, ax = plt.subplots()
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("Arithmetic intensity (flops/byte)")
+    ax.set_ylabel("Performance per node (flops/sec)")
+
+    for color_index, (key, dt) in enumerate(report.groupby('key', sort=False)):
+        ax.plot(dt['Intensity'], dt['GFLOPS'] / dt['worldsize'], 'o',
+                markersize=2, color=gr.colors_bs[color_index % len(gr.colors_bs)],
+                label=key)
+
+    intensity : np.ndarray = np.geomspace(report['Intensity'].min() / 4,
+                                          report['Intensity'].max() * 4, 100)
+    roof : np.ndarray = np.full_like(intensity, np.inf)
+    if peak:
+        roof = np.minimum(roof, peak * 1e9 * report['cpu_count'].max())
+    if bandwidth:
+        roof = np.minimum(roof, bandwidth * 1e9 * intensity)
+    if peak or bandwidth:
+        ax.plot(intensity, roof, '-', linewidth=1, color="black", label="roof")
+
+    plt.legend(bbox_to_anchor=(1,1),
+               loc='upper left', fontsize='x-small',
+               fancybox=True, shadow=True, ncol=1)
+
+    gr.save_all_files(filename, fig)
+    plt.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roofline and efficiency report of all the experiments.")
+    parser.add_argument("files", nargs="+", help="json files with experiment results")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="directory to cache the imported json files")
+    parser.add_argument("--store", choices=["pickle", "bundle", "none"], default="pickle",
+                        help="keep the roofline as pickle, as npz series bundle or not at all")
+    parser.add_argument("--write-queue", type=int, default=0, metavar="N",
+                        help="write the png in a background thread (default: 0, synchronous)")
+    parser.add_argument("--peak", type=float, default=None, metavar="GFLOPS",
+                        help="machine peak per core, for the peak fraction and the roof")
+    parser.add_argument("--bandwidth", type=float, default=None, metavar="GB/s",
+                        help="memory bandwidth per node, for the roof")
+    parser.add_argument("--top", type=int, default=1,
+                        help="configurations ranked per kernel and size (default: 1)")
+    args = parser.parse_args()
+    gr.figure_store = args.store
+    gr.set_write_queue(args.write_queue)
+    data : Dict[str, pd.DataFrame] = gr.import_json_list(args.files, args.cache)
+
+    try:
+        report : pd.DataFrame = get_report_table(data, args.peak)
+    except ValueError as error:
+        sys.exit(str(error))
+    report.to_csv("Report_all.csv", index = False)
+
+    ranking : pd.DataFrame = get_ranking(report, args.top)
+    print(ranking)
+    ranking.to_csv("Report_best.csv", index = False)
+
+    plot_roofline(report, args.peak, args.bandwidth, "Roofline")
+    gr.flush_images()
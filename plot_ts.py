@@ -21,7 +21,7 @@ import pandas as pd
 from typing import *
 
 
-def process_all(data : Dict[str, pd.DataFrame]):
+def process_all(data : Dict[str, pd.DataFrame], njobs : int = 1, lazy : bool = False):
     """Create all the blocksize graphs"""
 
     keys_list : list[str] = list(data.keys());
@@ -32,13 +32,29 @@ def process_all(data : Dict[str, pd.DataFrame]):
     ts_list : list[int] = first_dt['Tasksize'].drop_duplicates().sort_values().array
     cpu_list : list[int] = first_dt['cpu_count'].drop_duplicates().sort_values().array
 
-    # All benchmarks
+    # All benchmarks, every job receives only its slice of data.
+    selectors : Dict[str, gr.Selector] = {key : gr.Selector(data[key]) for key in keys_list}
+    jobs : list = []
     for row in rows_list:
         for ts in ts_list:
             for cpu_count in cpu_list:
-                gr.process_tasksize(data, keys_list, row, ts, cpu_count)
+                data_slice : Dict[str, pd.DataFrame] = {
+                    key : selectors[key].select(Rows=row, Tasksize=ts, cpu_count=cpu_count)
+                    for key in keys_list
+                }
+                jobs.append(("Scalability {} {} {} {}".format(keys_list[0].split("_")[0],
+                                                             row, ts, cpu_count),
+                             gr.process_tasksize,
+                             (data_slice, keys_list, row, ts, cpu_count)))
+
+    gr.run_jobs(jobs, njobs, lazy)
 
 
 if __name__ == "__main__":
-    data : Dict[str, pd.DataFrame] = gr.import_json_list(sys.argv[1:])
-    process_all(data)
+    args = gr.get_parser("Plot time, scalability and performance per tasksize.").parse_args()
+    gr.figure_store = args.store
+    gr.scaling_fits = args.fit
+    gr.scaling_nodes = args.predict
+    gr.set_write_queue(args.write_queue)
+    data : Dict[str, pd.DataFrame] = gr.import_json_list(args.files, args.cache)
+    process_all(data, args.jobs, args.lazy)
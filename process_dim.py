@@ -16,7 +16,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys, os, re
+import tempfile
+import argparse
+from math import sqrt
 from statistics import mean, stdev
+from concurrent.futures import ProcessPoolExecutor, wait
 
 import json
 
@@ -29,9 +33,14 @@ re_string = re.compile('^"(?P<string>.+?)"$') # KEY: "string"
 
 re_done = re.compile('')
 
-results = {}
+def split_executable(copydic :dict) -> tuple:
+    """Remove the Executable entry and return (basename, copydic)."""
+    exe = copydic.pop("Executable")
+    assert exe
+    return os.path.basename(exe), copydic
+
 
-def process_group(a_dict):
+def process_group(a_dict) -> tuple:
     """Process group of executions with same parameters."""
 
     copydic :dict = {}
@@ -57,16 +66,75 @@ def process_group(a_dict):
         else:
             sys.exit("List with mixed or unknown types: " + str(vals_list))
 
-    exe = copydic.pop("Executable")
-    assert exe
-    basename = os.path.basename(exe)
-    results.setdefault(basename, []).append(copydic)
+    return split_executable(copydic)
+
+
+class ListGroup(dict):
+    """Group that keeps all the values until the end of the group."""
+
+    def append(self, key :str, value) -> None:
+        self.setdefault(key, []).append(value)
+
+    def finish(self) -> tuple:
+        return process_group(self)
+
+
+class RunningGroup(dict):
+    """Group with running statistics, memory doesn't grow with the repetitions.
+
+    Floats keep [count, mean, M2] updated with Welford's method, int and
+    string keys keep [count, value].
+    """
+
+    def append(self, key :str, value) -> None:
+        entry :list | None = self.get(key)
+        if entry is None:
+            self[key] = [1, value, 0.0] if isinstance(value, float) else [1, value]
+        elif isinstance(value, float) != (len(entry) == 3):
+            sys.exit("List with mixed or unknown types: " + str(key))
+        elif len(entry) == 3:
+            entry[0] += 1
+            delta :float = value - entry[1]
+            entry[1] += delta / entry[0]
+            entry[2] += delta * (value - entry[1])
+        else:
+            assert value == entry[1], "Failed `all' instances!"
+            entry[0] += 1
+
+    def finish(self) -> tuple:
+        copydic :dict = {}
+        for key, entry in self.items():
+            count :int = entry[0]
+            if "executions" in copydic:
+                assert copydic["executions"] == count, "Unmatched array size"
+            else:
+                copydic["executions"] = count
+
+            copydic[key] = entry[1]
+            if len(entry) == 3:
+                copydic[key + "_stdev"] = sqrt(entry[2] / (count - 1)) if count > 1 else 0
+
+        return split_executable(copydic)
 
 
-def process_file(input_file):
-    """Process the files and stores the data in a map."""
+class JsonLinesWriter:
+    """Write every finished group as a json line: {basename: copydic}."""
 
-    line_dict :dict = {}
+    def __init__(self, fout):
+        self.fout = fout
+
+    def __call__(self, basename :str, copydic :dict) -> None:
+        self.fout.write(json.dumps({basename: copydic}) + "\n")
+        self.fout.flush()
+
+
+def process_file(input_file, sink, group_type = ListGroup):
+    """Process the files and stores the data in a map.
+
+    Every finished group is passed to sink(basename, copydic).
+    """
+
+    line_dict = group_type()
     count :int = 0
 
     for line in input_file:
@@ -77,8 +145,8 @@ def process_file(input_file):
                 count = count + 1
             elif match.group('report'):     # ============== end group
                 if count > 0:
-                    process_group(line_dict)
-                    line_dict = {}
+                    sink(*line_dict.finish())
+                    line_dict = group_type()
                     count = 0
             elif match.group('done'):
                 print("Fully executed!")
@@ -105,36 +173,222 @@ def process_file(input_file):
                     sys.exit("Value type with unknown regex: " + str(key) + " = " + str(strvalue))
 
             # Create or append
-            line_dict.setdefault(key, []).append(value)
+            line_dict.append(key, value)
             continue
 
     if count > 0:  # Lines ended, so this is the end hook
-        process_group(line_dict)
+        sink(*line_dict.finish())
+
+
+CHUNK_SIZE :int = 1 << 20   # bytes read per chunk by the fast engine
+
+
+def parse_value(key :str, strvalue :str):
+    """Convert the value of a pair to float, int or string like the regexes."""
+    if strvalue[0] == '"':
+        if len(strvalue) > 2 and strvalue[-1] == '"':
+            return strvalue[1:-1]                  # remove the " around string
+    elif strvalue.isdecimal():
+        return int(strvalue)
+    else:
+        match = re_number.match(strvalue)
+        if match:
+            if match.group('float'):
+                return float(match.group('number'))
+            return int(match.group('number'))
+
+    sys.exit("Value type with unknown regex: " + str(key) + " = " + str(strvalue))
+
+
+def process_file_fast(input_file, sink, group_type = ListGroup):
+    """Same as process_file, but dispatching on the first character.
+
+    The file is read in chunks of CHUNK_SIZE and most of the lines are
+    classified with string methods, only float values need a regex.
+    """
+
+    line_dict = group_type()
+    count :int = 0
+    values :dict = {}    # int and string values repeat a lot, parse them only once.
+
+    for lines in iter(lambda: input_file.readlines(CHUNK_SIZE), []):
+        for line in lines:
+            # Lines from readlines only have the '\n' at the end.
+            if line[0] == '#':
+                line = line.rstrip('\n')
+                if line.startswith("# -") and not line[3:].strip('-'):        # repetition
+                    count = count + 1
+                elif line.startswith("# =") and not line[3:].strip('='):      # end group
+                    if count > 0:
+                        sink(*line_dict.finish())
+                        line_dict = group_type()
+                        count = 0
+                elif line.startswith("# Done:  ") and len(line) > 9:
+                    print("Fully executed!")
+                    break
+                continue
+
+            # A pair value is always attached.
+            key, sep, strvalue = line.partition(": ")
+            if not sep or not key:
+                continue
+            strvalue = strvalue.rstrip('\n')
+            if not strvalue or not (key.isalnum() or key.replace('_', 'a').isalnum()):
+                continue
+
+            value = values.get(strvalue)
+            if value is None:
+                value = parse_value(key, strvalue)
+                if not isinstance(value, float):
+                    values[strvalue] = value
+
+            line_dict.append(key, value)
+        else:
+            continue
+        break   # Fully executed
+
+    if count > 0:  # Lines ended, so this is the end hook
+        sink(*line_dict.finish())
+
+
+engines :dict = {"regex": process_file, "fast": process_file_fast}
+
+
+def parse_file(fname_in :str, engine :str = "fast") -> list:
+    """Parse a .out file and return its groups as a list of (basename, copydic)."""
+    groups :list = []
+    with open(fname_in) as fin:
+        engines[engine](fin, lambda basename, copydic: groups.append((basename, copydic)))
+    return groups
+
+
+def stream_file(fname_in :str, fname_out :str, engine :str = "fast") -> str:
+    """Parse a .out file with running statistics writing its groups to fname_out."""
+    with open(fname_in) as fin, open(fname_out, "w") as fout:
+        engines[engine](fin, JsonLinesWriter(fout), RunningGroup)
+    return fname_out
+
+
+def merge_groups(groups_list :list) -> dict:
+    """Merge the groups of several files per executable basename.
+
+    The order in the output is the order of groups_list and then the order
+    of the groups in every file.
+    """
+    merged :dict = {}
+    for groups in groups_list:
+        for basename, copydic in groups:
+            merged.setdefault(basename, []).append(copydic)
+    return merged
+
+
+def process_dir(executor, dirname :str, stream :bool, engine :str, partdir :str) -> list:
+    """Submit all the .out files in dirname, sorted by name.
+
+    Returns a list of (fname_in, fname_part, future). In stream mode every
+    file is written to its own part in partdir, else fname_part is None.
+    """
+    futures :list = []
+    for basename_in in sorted(f for f in os.listdir(dirname) if f.endswith(".out")):
+        fname_in = os.path.join(dirname, basename_in)
+        if stream:
+            fname_part = os.path.join(partdir, str(len(futures)) + ".jsonl")
+            # Created here so write_stream can follow it before the worker starts.
+            open(fname_part, "w").close()
+            future = executor.submit(stream_file, fname_in, fname_part, engine)
+        else:
+            fname_part = None
+            future = executor.submit(parse_file, fname_in, engine)
+        futures.append((fname_in, fname_part, future))
+    return futures
+
+
+def copy_lines(fpart, fout) -> None:
+    """Copy the complete lines of fpart to fout, leave a partial one for later."""
+    while True:
+        position :int = fpart.tell()
+        line :str = fpart.readline()
+        if not line.endswith("\n"):
+            fpart.seek(position)
+            break
+        fout.write(line)
+    fout.flush()
+
+
+def write_stream(futures :list, fname_out :str, poll :float = 0.1) -> None:
+    """Write the groups of the files to fname_out in the order of futures.
+
+    The part of the first unfinished file is followed while it runs, so its
+    groups reach fname_out every poll seconds as they finish; the parts of
+    the next files wait until it is done. A crash loses only the groups of
+    the files behind it.
+    """
+    with open(fname_out, "w") as fout:
+        for fname_in, fname_part, future in futures:
+            with open(fname_part) as fpart:
+                while not future.done():
+                    copy_lines(fpart, fout)
+                    wait([future], timeout=poll)
+                copy_lines(fpart, fout)
+            os.remove(fname_part)
+
+            try:
+                future.result()
+            except IOError:
+                print("Couldn't read input:", fname_in, file = sys.stderr)
+                continue
+            print("Processed:", fname_in)
 
 
 if __name__ == "__main__":
-    for dirname in sys.argv[1:]:
-        if os.path.isdir(dirname):
+    parser = argparse.ArgumentParser(description="Collect the .out files of every directory in a json.")
+    parser.add_argument("dirs", nargs="+", help="directories with .out files")
+    parser.add_argument("--stream", action="store_true",
+                        help="write the groups to a .jsonl file as they finish, in the order "
+                        "of the files, with running statistics and bounded memory")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of processes parsing files (default: number of cores)")
+    parser.add_argument("--engine", choices=engines.keys(), default="fast",
+                        help="line tokenizer (default: fast)")
+    args = parser.parse_args()
+
+    dirnames :list = [d for d in args.dirs if os.path.isdir(d)]
+
+    # The stream parts go to a temporary directory, removed even on errors.
+    with tempfile.TemporaryDirectory() as tmpdir, \
+         ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        # Submit the files of all the directories first so they all run in parallel.
+        submitted :list = [(dirname, process_dir(executor, dirname, args.stream, args.engine,
+                                                 tempfile.mkdtemp(dir=tmpdir)))
+                           for dirname in dirnames]
+
+        for dirname, futures in submitted:
             print("Going into:", dirname)
-            results = {}
-            # Process input
-            for basename_in in [f for f in os.listdir(dirname) if f.endswith(".out")]:
-                fname_in = os.path.join(dirname, basename_in)
+
+            if args.stream:
+                fname_out = dirname.rstrip(os.sep) + ".jsonl"
+                print("Writing:", fname_out)
+                try:
+                    write_stream(futures, fname_out)
+                except IOError:
+                    print("Couldn't write output file", file = sys.stderr)
+                continue
+
+            groups_list :list = []
+            for fname_in, _, future in futures:
                 print("Processing:", fname_in, end=' ')
                 try:
-                    with open(fname_in) as fin:
-                        process_file(fin)
+                    groups_list.append(future.result())
                     print("Ok")
                 except IOError:
                     print("Couldn't read input:", fname_in, file = sys.stderr)
 
             # Write output
-            fname_out = dirname.rstrip(os.sep)+".json"
+            fname_out = dirname.rstrip(os.sep) + ".json"
             print("Writing:", fname_out, end=' ')
             try:
                 with open(fname_out, "w") as fout:
-                    json.dump(results, fout, indent=4)
+                    json.dump(merge_groups(groups_list), fout, indent=4)
                 print("Ok")
             except IOError:
                 print("Couldn't write output file", file = sys.stderr)
-
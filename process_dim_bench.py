@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022  Jimmy Aguilar Mena
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Micro-benchmark of the process_dim tokenizer engines on synthetic logs.
+#
+# ./process_dim_bench.py 1000000 10000000
+
+import sys, os
+import random
+import tempfile
+import time
+
+import process_dim
+
+REPETITIONS :int = 5
+
+def write_log(fout, nlines :int) -> None:
+    """Write a synthetic .out log with approximately nlines lines."""
+    random.seed(0)
+    group :int = 0
+    written :int = 0
+
+    fout.write("# Synthetic log\n")
+    while written < nlines:
+        for rep in range(REPETITIONS):
+            fout.write('Executable: "/apps/bin/cholesky_fare_ompss2"\n')
+            fout.write("Rows: %d\n" % (1024 << (group % 4)))
+            fout.write("Tasksize: %d\n" % (32 << (group % 3)))
+            fout.write("cpu_count: %d\n" % 48)
+            fout.write("worldsize: %d\n" % (1 << (group % 5)))
+            fout.write("namespace_enabled: %d\n" % (group % 2))
+            fout.write("Algorithm_time: %.6f\n" % random.uniform(1, 2))
+            fout.write("Other_time: %.6e\n" % random.random())
+            fout.write('Name: "cholesky"\n')
+            fout.write("# ------------------------------\n")
+        fout.write("# ==============================\n")
+        group = group + 1
+        written = written + REPETITIONS * 10 + 1
+
+
+class CountGroup(dict):
+    """Group that only counts the values, to time the tokenizer alone."""
+
+    def append(self, key :str, value) -> None:
+        self[key] = self.get(key, 0) + 1
+
+    def finish(self) -> tuple:
+        return "count", dict(self)
+
+
+def tokenize(engine :str, fname :str) -> float:
+    """Time only the tokenizer of engine on fname."""
+    start :float = time.perf_counter()
+    with open(fname) as fin:
+        process_dim.engines[engine](fin, lambda basename, copydic: None, CountGroup)
+    return time.perf_counter() - start
+
+
+def run(engine :str, fname :str) -> tuple:
+    """Parse fname with engine, return (seconds, groups)."""
+    start :float = time.perf_counter()
+    groups :list = process_dim.parse_file(fname, engine)
+    return time.perf_counter() - start, groups
+
+
+if __name__ == "__main__":
+    sizes :list = [int(arg) for arg in sys.argv[1:]] or [10**6, 10**7]
+
+    for nlines in sizes:
+        with tempfile.NamedTemporaryFile("w", suffix=".out", delete=False) as fout:
+            write_log(fout, nlines)
+            fname :str = fout.name
+
+        try:
+            size :float = os.path.getsize(fname) / 2**20
+            print("Lines: {} ({:.1f} MB)".format(nlines, size))
+
+            reference :list | None = None
+            base :tuple | None = None
+            for engine in process_dim.engines:
+                tokens :float = tokenize(engine, fname)
+                seconds, groups = run(engine, fname)
+                if reference is None:
+                    reference, base = groups, (tokens, seconds)
+                elif groups != reference:
+                    sys.exit("Engine " + engine + " produced different groups")
+
+                print("  {:6s} tokenize: {:7.3f}s {:6.1f} MB/s x{:.2f}"
+                      "   full: {:7.3f}s {:6.1f} MB/s x{:.2f}".format(
+                          engine,
+                          tokens, size / tokens, base[0] / tokens,
+                          seconds, size / seconds, base[1] / seconds))
+        finally:
+            os.remove(fname)
@@ -0,0 +1,137 @@
+# Copyright (C) 2022  Ergus
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Scaling models of the time vs number of nodes, fitted to every series of
+# a table at once.
+
+import pandas as pd
+import numpy as np
+from typing import *
+
+from collections.abc import Callable
+
+
+class ScalingModel(NamedTuple):
+    """Time model that is linear in its parameters.
+
+    basis gives the (n, k) design matrix for the node counts p. With
+    reciprocal the basis models 1/T(p) instead of T(p). fraction gets the
+    parallel fraction from the (groups, k) parameters, or None.
+    """
+    params : list[str]
+    basis : Callable[[np.ndarray], np.ndarray]
+    reciprocal : bool = False
+    fraction : Callable[[np.ndarray], np.ndarray] | None = None
+
+
+models : Dict[str, ScalingModel] = {
+    # Amdahl: T(p) = serial + parallel / p
+    "amdahl" : ScalingModel(["serial", "parallel"],
+                            lambda p: np.stack([np.ones_like(p), 1 / p], axis=-1),
+                            fraction=lambda c: c[:, 1] / (c[:, 0] + c[:, 1])),
+    # Gustafson: speedup (1 - f) + f p, so 1/T(p) = a + b p with f = b / (a + b)
+    "gustafson" : ScalingModel(["a", "b"],
+                               lambda p: np.stack([np.ones_like(p), p], axis=-1),
+                               reciprocal=True,
+                               fraction=lambda c: c[:, 1] / (c[:, 0] + c[:, 1])),
+    # Communication overhead: T(p) = work / p + alpha + beta log2(p)
+    "comm" : ScalingModel(["work", "alpha", "beta"],
+                          lambda p: np.stack([1 / p, np.ones_like(p), np.log2(p)], axis=-1)),
+}
+
+
+def predict(coefs : np.ndarray, name : str, p : np.ndarray) -> np.ndarray:
+    """(groups, len(p)) times of the model with (groups, k) coefs at p nodes.
+
+    The model doesn't hold where it gives a time <= 0, the time is NaN there.
+    """
+    model : ScalingModel = models[name]
+    values : np.ndarray = coefs @ model.basis(np.asarray(p, dtype=float)).T
+    values = np.where(values > 0, values, np.nan)
+    return 1 / values if model.reciprocal else values
+
+
+def fit(dt : pd.DataFrame, name : str, by : list[str] = [],
+        x : str = 'worldsize', y : str = 'Algorithm_time') -> pd.DataFrame:
+    """Fit the model to every by group of dt with a single batched solve.
+
+    The least squares minimize the relative error, so the single node times
+    don't dominate the fit, and the normal equations of all the groups are
+    accumulated and solved together. The groups with less points than
+    parameters (or a singular system) get NaN. The result has a row per
+    group with the parameters, T1 (the modeled single node time), the
+    parallel fraction, the relative RMS error and the number of points n.
+    """
+    model : ScalingModel = models[name]
+    k : int = len(model.params)
+    dt = dt.dropna(subset=[x, y])
+
+    if by:
+        grouped = dt.groupby(by, sort=True)
+        groups : np.ndarray = grouped.ngroup().to_numpy()
+        index : pd.Index = grouped.size().index
+    else:
+        groups = np.zeros(len(dt), dtype=int)
+        index = pd.RangeIndex(1 if len(dt) else 0)
+
+    ngroups : int = len(index)
+    p : np.ndarray = dt[x].to_numpy(dtype=float)
+    t : np.ndarray = dt[y].to_numpy(dtype=float)
+    target : np.ndarray = 1 / t if model.reciprocal else t
+
+    # Relative residuals: (target - X c) / target = 1 - (X / target) c
+    X : np.ndarray = model.basis(p) / target[:, None]
+    xtx : np.ndarray = np.zeros((ngroups, k, k))
+    np.add.at(xtx, groups, X[:, :, None] * X[:, None, :])
+    xty : np.ndarray = np.zeros((ngroups, k))
+    np.add.at(xty, groups, X)
+
+    coefs : np.ndarray = np.einsum('gij,gj->gi', np.linalg.pinv(xtx), xty)
+    counts : np.ndarray = np.bincount(groups, minlength=ngroups)
+    coefs[(counts < k) | (np.linalg.matrix_rank(xtx) < k)] = np.nan
+
+    fitted : np.ndarray = np.einsum('nk,nk->n', model.basis(p), coefs[groups])
+    if model.reciprocal:
+        fitted = 1 / fitted
+    error : np.ndarray = np.bincount(groups, ((fitted - t) / t)**2, minlength=ngroups)
+
+    result : pd.DataFrame = pd.DataFrame(coefs, index=index, columns=model.params)
+    result['T1'] = predict(coefs, name, [1])[:, 0]
+    result['fraction'] = model.fraction(coefs) if model.fraction else np.nan
+    result['rel_rmse'] = np.sqrt(error / np.maximum(counts, 1))
+    result['n'] = counts
+    return result
+
+
+def report(dt : pd.DataFrame, names : list[str], by : list[str],
+           nodes : list[int] = []) -> pd.DataFrame:
+    """Fits of all the models with their predicted time and efficiency at nodes.
+
+    A row per (group, model), the efficiency at p nodes is T1 / (p T(p)).
+    """
+    tables : list[pd.DataFrame] = []
+    for name in names:
+        fits : pd.DataFrame = fit(dt, name, by)
+        coefs : np.ndarray = fits[models[name].params].to_numpy()
+        times : np.ndarray = predict(coefs, name, nodes)
+
+        table : pd.DataFrame = fits[['T1', 'fraction', 'rel_rmse', 'n']].copy()
+        for i, p in enumerate(nodes):
+            table['T(' + str(p) + ')'] = times[:, i]
+            table['E(' + str(p) + ')'] = table['T1'] / (p * times[:, i])
+        table.insert(0, 'model', name)
+        tables.append(table)
+
+    return pd.concat(tables).reset_index() if by else pd.concat(tables).reset_index(drop=True)
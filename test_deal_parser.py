@@ -0,0 +1,37 @@
+import io
+
+from deal_parser import MyDict
+
+def command(name: str) -> str:
+    return f"# Command: ProtoGridLauncher.exe -c soam.json -i inputs/{name}.json -o out/{name}_result_0.json 2>&1\n"
+
+def parse(log: str) -> dict:
+    return {key: list(values) for key, values in MyDict.parseLogFile(io.StringIO(log)).items()}
+
+def test_crashed_job_is_dropped():
+    log = ("\n# Before (default)\n#   o: out\n"
+           + command("A") + "Loading request\nSegmentation fault\n"
+           + command("B") + "Loading request\nTotal execution time: 2.0s\n"
+           + command("C") + "Loading request\nTotal execution time: 3.0s\n")
+    assert parse(log) == {"B": [2.0], "C": [3.0]}
+
+def test_crashed_job_without_output():
+    log = ("\n# Before (default)\n#   o: out\n"
+           + command("A")
+           + command("B") + "Total execution time: 2.0s\n"
+           + command("C") + "Total execution time: 3.0s\n")
+    assert parse(log) == {"B": [2.0], "C": [3.0]}
+
+def test_crashed_job_in_grid_runner_log():
+    log = ("\n# executable: ProtoGridLauncher.exe connection: soam.json max_parallel: 2\n"
+           + command("A") + "Killed\n"
+           + command("B") + "Total execution time: 2.0s\n"
+           + command("C") + "Total execution time: 3.0s\n")
+    assert parse(log) == {"B": [2.0], "C": [3.0]}
+
+def test_parallel_log_with_crashed_job():
+    log = ("\n# Before (default)\n#   p: true\n"
+           + command("A") + command("B") + command("C")
+           + "Sending response to out/C_result_0.json\nTotal execution time: 3.0s\n"
+           + "Sending response to out/B_result_0.json\nTotal execution time: 2.0s\n")
+    assert parse(log) == {"C": [3.0], "B": [2.0]}